@@ -0,0 +1,92 @@
+import json
+import os
+import tempfile
+import threading
+
+states_file = 'analyzer_states.json'
+states_version = 1
+
+# stations in one process share the states file, each writes its own analyzer's entries into it
+_file_lock = threading.Lock()
+
+# settings a recalled state doesn't bring back or that change during a sweep, they're never stored
+volatile = ('FORMAT', ':PARAMETER:SELECT')
+
+
+class AnalyzerStates(object):
+    # instrument states saved on the analyzer (MMEMory:STORe *.csa) plus, locally,
+    # the settings each one holds, so a recall leaves nothing to rewrite
+
+    def __init__(self, path=states_file, telemetry=None):
+        self._path = path
+        self._log = print if telemetry is None else telemetry.log
+        self.catalog = set()
+        self.idn = ''
+        self._entries = None
+
+    def check_catalog(self, session):
+        # files on the analyzer, states recorded for another analyzer or since deleted don't count
+        self.idn = session.query('*IDN?').strip()
+        reply = session.query('MMEMory:CATalog?').strip().strip('"')
+        self.catalog = {name.strip().strip('"').lower() for name in reply.split(',') if name.strip()}
+        self._log(f'analyzer states: {", ".join(sorted(n for n in self.catalog if n.endswith(".csa"))) or "none"}')
+        return self.catalog
+
+    def recall(self, session, name):
+        if name.lower() not in self.catalog:
+            return False
+        settings = self._load().get(self.idn, dict()).get(name)
+        if settings is None:
+            return False
+
+        session.queue(f'MMEMory:LOAD "{name}"')
+        session.restore(settings)
+        self._log(f'analyzer state recalled: {name}')
+        return True
+
+    def store(self, session, name):
+        # only if the analyzer holds settings the saved state doesn't have
+        settings = {key: value for key, value in session.snapshot().items()
+                    if not any(part in key for part in volatile)}
+        entries = self._load()
+        saved = entries.get(self.idn, dict()).get(name) if name.lower() in self.catalog else None
+        if saved == settings:
+            return False
+        if saved is not None and not saved.keys() <= settings.keys():
+            # preset since the recall, the saved state still holds setups this one lacks, keep it
+            self._log(f'analyzer state kept: {name}, {len(saved.keys() - settings.keys())} settings not set up yet')
+            return False
+
+        session.queue(f'MMEMory:STORe "{name}"')
+        session.sync()
+
+        with _file_lock:
+            # other stations may have stored their states since this one last read the file
+            self._entries = None
+            entries = self._load()
+            entries.setdefault(self.idn, dict())[name] = settings
+            self._save(entries)
+        self.catalog.add(name.lower())
+        self._log(f'analyzer state stored: {name}')
+        return True
+
+    def _load(self):
+        if self._entries is not None:
+            return self._entries
+        self._entries = dict()
+        try:
+            with open(self._path, mode='rt', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return self._entries
+        if entry.get('version') == states_version:
+            self._entries = entry.get('states', dict())
+        return self._entries
+
+    def _save(self, entries):
+        # write-then-rename, same as the instrument cache, the temp name is unique per writer
+        fd, tmp = tempfile.mkstemp(prefix=os.path.basename(self._path) + '.', suffix='.tmp',
+                                   dir=os.path.dirname(os.path.abspath(self._path)))
+        with os.fdopen(fd, mode='wt', encoding='utf-8') as f:
+            json.dump({'version': states_version, 'states': entries}, f, indent=2)
+        os.replace(tmp, self._path)
@@ -0,0 +1,171 @@
+import asyncio
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from instrumentmanager import InstrumentManager
+
+# the drivers block, their calls run on a small shared pool instead of a thread per instrument
+io_threads = 4
+# seconds a single instrument call may take before the awaiting side gives up
+call_timeout = 10.0
+
+
+class AsyncInstrument(object):
+    # awaitable front of a blocking driver:
+    # calls to one instrument are serialized, calls to different instruments run concurrently
+
+    def __init__(self, inst, executor, timeout=call_timeout):
+        self._inst = inst
+        self._executor = executor
+        self._lock = asyncio.Lock()
+        self.timeout = timeout
+
+    @property
+    def inst(self):
+        return self._inst
+
+    @property
+    def lock(self):
+        return self._lock
+
+    async def run(self, fn, *args, timeout=None):
+        # fn gets the instrument to itself, e.g. a manager step that talks to it
+        async with self._lock:
+            return await self._call(fn, *args, timeout=timeout)
+
+    async def _call(self, fn, *args, timeout=None):
+        future = asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout or self.timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            # a driver call can't be interrupted, the instrument stays taken until it returns
+            await asyncio.wait([future])
+            raise
+
+    async def send(self, command, timeout=None):
+        return await self.run(self._inst.send, command, timeout=timeout)
+
+    async def query(self, question, timeout=None):
+        return await self.run(self._inst.query, question, timeout=timeout)
+
+    async def read_raw(self, timeout=None):
+        return await self.run(self._inst.read_raw, timeout=timeout)
+
+    async def set_lpf_code(self, code, timeout=None):
+        return await self.run(self._inst.set_lpf_code, code, timeout=timeout)
+
+
+class AsyncInstrumentManager(InstrumentManager):
+    # InstrumentManager's steps driven from one event loop:
+    # each instrument is an awaitable lane, a sweep is a task that can be cancelled or time out,
+    # the next code is written while the analyzer is read out without an extra thread
+
+    def __init__(self, store=None, executor=None):
+        super().__init__(store=store)
+        self._executor = executor or ThreadPoolExecutor(max_workers=io_threads, thread_name_prefix='instrument')
+
+        self.analyzer = None
+        self.progr = None
+
+    def _lanes(self):
+        self.analyzer = AsyncInstrument(self._analyzer, self._executor) if self._analyzer is not None else None
+        self.progr = AsyncInstrument(self._progr, self._executor) if self._progr is not None else None
+
+    def findInstruments(self, rescan=False):
+        found = super().findInstruments(rescan)
+        self._lanes()
+        return found
+
+    def attach(self, analyzer, progr, fast_mock=False):
+        super().attach(analyzer, progr, fast_mock=fast_mock)
+        self._lanes()
+
+    async def find_instruments(self, rescan=False):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self.findInstruments, rescan)
+
+    async def exclusive(self, fn, *args, timeout=None):
+        # steps that talk to both instruments hold both lanes
+        async with self.progr.lock:
+            return await self.analyzer.run(fn, *args, timeout=timeout)
+
+    async def check_sample(self):
+        return await self.exclusive(self.checkSample)
+
+    async def switch(self, code):
+        with self._timer.stage('switch', code=code):
+            await self.progr.set_lpf_code(code)
+
+    async def measure(self, params, progress=None, chip=None):
+        # progress(done, total) is called from the event loop
+        self._telemetry.log(f'instrument manager: start measure {params}')
+
+        if chip is None:
+            chip = time.strftime('%Y%m%d-%H%M%S')
+
+        self._cancel.clear()
+        self._timer.clear()
+        self._telemetry.clear()
+        self.clear_data()
+
+        with self._timer.stage('sweep'):
+            await self.measure_task(params, progress, chip)
+
+        elapsed = self._timer.totals()['sweep'][1]
+        self._telemetry.log(f'instrument manager: end measure, {elapsed:.2f} s async')
+
+    async def measure_task(self, params, progress=None, chip=''):
+        self._telemetry.log(f'measurement task run {params}')
+
+        with self._timer.stage('setup'):
+            chan, names, bulk, settle = await self.exclusive(self.setup_measure, params)
+        items, sweep = self.begin_results(params, chip)
+
+        measured = 0
+        pending = None
+
+        try:
+            for index, (label, code) in enumerate(items):
+                if self._cancel.is_set():
+                    self._telemetry.log(f'measurement task aborted at code {code}')
+                    break
+
+                self._timer.code = self._telemetry.code = code
+                if pending is None:
+                    await self.switch(code)
+                else:
+                    with self._timer.stage('switch wait'):
+                        await pending
+                    pending = None
+
+                await self.analyzer.run(self.settle_code, code, settle)
+
+                with self._timer.stage('trigger'):
+                    await self.analyzer.run(self.sweep, chan)
+
+                if index + 1 < len(items):
+                    # this code's traces are held by the analyzer, the next write runs alongside the readout
+                    pending = asyncio.ensure_future(self.switch(items[index + 1][1]))
+
+                self._sweep_cube[index] = await self.analyzer.run(self.read_code, chan, names, bulk)
+
+                measured = self.finish_code(sweep, index, label, code, progress)
+        finally:
+            if pending is not None:
+                # cancelled or failed mid-sweep, a write in flight is let to finish
+                await asyncio.wait([pending])
+                if not pending.cancelled():
+                    pending.exception()
+            self.end_results(sweep, measured)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+def qt_event_loop(app):
+    # asyncio on top of the Qt event loop: coroutines, slots and repaints share the GUI thread
+    import qasync
+
+    loop = qasync.QEventLoop(app)
+    asyncio.set_event_loop(loop)
+    return loop
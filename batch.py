@@ -0,0 +1,110 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+
+import evaluation
+import resultcube
+
+from tracehistory import TraceHistory
+
+# per-process state, set up once by the pool initializer
+_history = None
+_limits = None
+_code_atts = None
+
+
+def _init_worker(path, limits, code_atts):
+    global _history, _limits, _code_atts
+    _history = TraceHistory(path)
+    _limits = limits
+    _code_atts = code_atts
+
+
+def _evaluate_chunk(sweeps):
+    rows = list()
+    for sweep in sweeps:
+        info = _history.sweeps[sweep]
+        chip_type = info['chip_type']
+
+        codes, atts, cube = _history.load_cube(sweep)
+        if _code_atts is not None and chip_type in _code_atts:
+            table = _code_atts[chip_type]
+            atts = numpy.array([table.get(code, att) for code, att in zip(codes, atts)])
+
+        values, passed = evaluation.evaluate(_history.freqs(sweep), cube, atts, _limits[chip_type])
+        rows.append((info['chip'], chip_type, info['ts'], sweep, values.tolist(), passed.tolist()))
+    return rows
+
+
+def load_limits(path):
+    # {"<chip type>": [6 limits in evaluation.labels order]}
+    limits = dict(evaluation.standard)
+    if path:
+        with open(path, mode='rt', encoding='utf-8') as f:
+            limits.update({int(k): v for k, v in json.load(f).items()})
+    return limits
+
+
+def load_code_atts(path):
+    # {"<chip type>": {"<nominal att>": code}}, single-bit table like InstrumentManager.level_codes,
+    # turned into code -> nominal att for every state
+    if not path:
+        return None
+    with open(path, mode='rt', encoding='utf-8') as f:
+        levels = json.load(f)
+    return {int(chip_type): {code: att for att, code in resultcube.full_codes(
+                {float(att): code for att, code in table.items()}).items()}
+            for chip_type, table in levels.items()}
+
+
+def run(path, out, limits=None, codes=None, workers=None, chunk=64, latest=True):
+    history = TraceHistory(path)
+    sweeps = history.select(latest=latest)
+    print(f'batch: {len(sweeps)} sweeps from {len(history.chips)} chips in {path}')
+
+    chunks = [sweeps[i:i + chunk] for i in range(0, len(sweeps), chunk)]
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(path, load_limits(limits), load_code_atts(codes))) as pool:
+        results = [row for rows in pool.map(_evaluate_chunk, chunks) for row in rows]
+    elapsed = time.perf_counter() - start
+
+    passed = 0
+    with open(out, mode='wt', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['chip', 'type', 'time', 'sweep'] + evaluation.labels + [f'{l} ok' for l in evaluation.labels]
+                        + ['ok'])
+        for chip, chip_type, ts, sweep, values, oks in results:
+            ok = all(oks)
+            passed += ok
+            writer.writerow([chip, chip_type, time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(ts)), sweep]
+                            + [f'{v:.3f}' for v in values] + [int(o) for o in oks] + [int(ok)])
+
+    rate = len(results) / elapsed if elapsed else 0.0
+    print(f'batch: {passed} of {len(results)} passed, {elapsed:.1f} s, {rate:.0f} chips/s, summary in {out}')
+    return results
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description='Re-evaluate stored sweeps against a limit table')
+    parser.add_argument('--store', default='results', help='trace store directory')
+    parser.add_argument('--out', default='summary.csv', help='summary table')
+    parser.add_argument('--limits', help='JSON limit table, overrides the built-in standard')
+    parser.add_argument('--codes', help='JSON level table, overrides stored nominal attenuations')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--all', action='store_true', help='every sweep, not only the latest per chip')
+    opts = parser.parse_args(args[1:])
+
+    run(opts.store, opts.out, opts.limits, opts.codes, opts.workers, latest=not opts.all)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,499 @@
+import sys
+import time
+
+from itertools import repeat
+
+import numpy
+
+import simulator
+
+from instrumentmanager import InstrumentManager
+
+simulator.strict = True
+
+
+class TraceAnalyzerMock(object):
+    # answers FDATA queries in whatever format the manager has set up
+
+    def __init__(self, points=1601):
+        self.name = 'E8362B bench mock'
+        self._trace = numpy.random.uniform(-60, 0, points)
+        self._ascii = ','.join(f'{p:+.12E}' for p in self._trace) + '\n'
+        self._block = b''
+        self.bytes_read = 0
+
+    def send(self, command):
+        # replies are prepared up front so only the manager's side is timed
+        if command.startswith('FORMat:DATA'):
+            dtype = {'REAL,32': '<f4', 'REAL,64': '<f8'}.get(command.split(' ')[1])
+            if dtype:
+                payload = self._trace.astype(dtype).tobytes()
+                length = str(len(payload))
+                self._block = f'#{len(length)}{length}'.encode() + payload + b'\n'
+
+    def query(self, question):
+        self.bytes_read += len(self._ascii)
+        return self._ascii
+
+    def read_raw(self):
+        self.bytes_read += len(self._block)
+        return self._block
+
+
+class FakeSerial(object):
+    # programmer port stand-in, the behaviour comes from the port name:
+    # COM1 answers the handshake, SLOW answers after slow_delay, SILENT never answers, anything else doesn't exist
+    slow_delay = 5.0
+
+    def __init__(self, port, timeout=None, **kwargs):
+        if port not in ['COM1', 'SLOW', 'SILENT']:
+            import serial
+            raise serial.SerialException(f'could not open port {port}')
+        self._port = port
+        self._timeout = timeout or 0.0
+        self._answer_at = None
+
+    @property
+    def in_waiting(self):
+        return 0
+
+    def write(self, data):
+        from discovery import arduino_handshake
+        if data == arduino_handshake and self._port != 'SILENT':
+            self._answer_at = time.monotonic() + (self.slow_delay if self._port == 'SLOW' else 0.01)
+
+    def read(self, size=1):
+        # blocks for at most the port timeout, like pyserial
+        if self._answer_at is not None and time.monotonic() >= self._answer_at:
+            self._answer_at = None
+            return b'ARDUINO'
+        time.sleep(self._timeout)
+        return b''
+
+    def close(self):
+        pass
+
+
+class FakeVisaResource(object):
+
+    def __init__(self, idn, delay, hang):
+        self._idn = idn
+        self._delay = delay
+        self._hang = hang
+        self.timeout = 2000
+
+    def query(self, question):
+        if self._hang:
+            # a driver call that ignores its own timeout
+            time.sleep(self._delay)
+        elif self._delay * 1000 > self.timeout:
+            time.sleep(self.timeout / 1000)
+            raise TimeoutError('VI_ERROR_TMO')
+        return self._idn
+
+    def close(self):
+        pass
+
+
+class FakeResourceManager(object):
+    # the analyzer answers at once, one instrument times out, one driver call hangs past every timeout
+
+    resources = {
+        'GPIB0::16::INSTR': ('Agilent Technologies,E8362B,MY43021234,A.09.42.08\n', 0.0, False),
+        'GPIB0::5::INSTR': ('', 10.0, False),
+        'GPIB0::7::INSTR': ('', 6.0, True),
+    }
+
+    def list_resources(self):
+        return tuple(self.resources)
+
+    def open_resource(self, addr, open_timeout=0):
+        return FakeVisaResource(*self.resources[addr])
+
+
+def bench_transfer(points=1601, repeat=200):
+    manager = InstrumentManager()
+    analyzer = TraceAnalyzerMock(points=points)
+    manager.attach(analyzer, None)
+
+    print(f'trace transfer, {points} points, {repeat} traces')
+    for fmt in ['ascii', 'real32', 'real64']:
+        if fmt != 'ascii':
+            analyzer.send(f'FORMat:DATA {manager.data_formats[fmt][0]}')
+        manager._format = fmt
+        analyzer.bytes_read = 0
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            manager.read_trace('CALCulate1:DATA? FDATA')
+        elapsed = time.perf_counter() - start
+
+        print(f'{fmt:>8}: {analyzer.bytes_read // repeat:>7} bytes/trace, '
+              f'{elapsed / repeat * 1_000_000:>8.1f} us/trace')
+
+
+def bench_telemetry(points=1601, repeat=2000):
+    # instrument calls through the telemetry proxy, off must cost about nothing
+    from scpisession import ScpiSession
+    from telemetry import TracedInstrument
+
+    manager = InstrumentManager()
+    analyzer = TraceAnalyzerMock(points=points)
+    analyzer.send(f'FORMat:DATA {manager.data_formats["real64"][0]}')
+    manager._format = 'real64'
+
+    print(f'telemetry, {points} points, {repeat} traces')
+    for label, inst, enabled in [('direct', analyzer, False),
+                                 ('off', TracedInstrument(analyzer, manager.telemetry), False),
+                                 ('on', TracedInstrument(analyzer, manager.telemetry), True)]:
+        manager._analyzer = inst
+        manager._session = ScpiSession(inst)
+        manager.telemetry.enabled = enabled
+        manager.telemetry.clear()
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            manager.read_trace('CALCulate1:DATA? FDATA')
+        elapsed = time.perf_counter() - start
+
+        print(f'{label:>8}: {elapsed / repeat * 1_000_000:>8.2f} us/trace, {len(manager.telemetry.events)} events')
+
+
+def bench_stations(stations=4, chips=16):
+    # simulated stations with real sweep timing, all writing one store like on the line
+    import contextlib
+    import io
+    import tempfile
+
+    from station import Station, StationScheduler
+    from tracestore import shared_store
+
+    store = shared_store(tempfile.mkdtemp(prefix='att_bench_'))
+    with contextlib.redirect_stdout(io.StringIO()):
+        scheduler = StationScheduler([Station.sim(f'station {i + 1}', store=store, seed=i) for i in range(stations)])
+        scheduler.run([(f'chip {i + 1}', i % 2) for i in range(chips)])
+    store.close()
+
+    print(f'{stations} stations, {chips} chips: {scheduler.throughput():.1f} chips/hour, {scheduler.elapsed:.1f} s')
+    if scheduler.failed:
+        print(f'stations: {len(scheduler.failed)} chips FAILED, {next(iter(scheduler.failed.values()))}')
+    for name, (count, busy) in scheduler.station_stats().items():
+        print(f'{name:>12}: {count} chips, {busy:.2f} s busy')
+
+
+def bench_plot(codes=64, points=1601, frames=10):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    from traceplot import TracePlot
+
+    freqs = numpy.linspace(10_000_000, 8_000_000_000, points)
+    # trace-like data: per-code offset, slope over the band and a bit of noise
+    shape = -numpy.arange(codes)[:, numpy.newaxis] * 0.5 - numpy.linspace(0, 3, points)
+    data = [shape + numpy.random.normal(0, 0.05, (codes, points)) for _ in range(frames)]
+
+    print(f'plot, {codes} codes, {points} points, {frames} frames')
+
+    # figures are sized like one PlotWidget tile
+    # full rebuild, the way PlotWidget used to draw
+    fig = Figure(figsize=(3, 2.5))
+    FigureCanvasAgg(fig)
+    start = time.perf_counter()
+    for ys in data:
+        fig.clear()
+        fig.set_tight_layout(True)
+        ax = fig.gca()
+        ax.set_title('title')
+        ax.grid(True, linestyle='--')
+        ax.tick_params(labelsize='small', direction='in', pad=2, grid_alpha=0.5)
+        for y in ys:
+            ax.plot(freqs, y)
+        fig.canvas.draw()
+    print(f' rebuild: {frames / (time.perf_counter() - start):>6.1f} frames/s')
+
+    for lod in [False, True]:
+        fig = Figure(figsize=(3, 2.5))
+        FigureCanvasAgg(fig)
+        plot = TracePlot(fig, 'title', lod=lod)
+        start = time.perf_counter()
+        for ys in data:
+            plot.update(repeat(freqs), ys)
+            plot.draw()
+        label = 'lod' if lod else 'persist'
+        print(f'{label:>8}: {frames / (time.perf_counter() - start):>6.1f} frames/s')
+
+
+def bench_startup(runs=5, budget=0.5):
+    # headless entry point must not pull in the GUI or hardware stack
+    import os
+    import subprocess
+
+    heavy = ['PyQt5', 'matplotlib', 'visa', 'pyvisa', 'serial']
+    code = f'import sys, cli; print(",".join(m for m in {heavy!r} if m in sys.modules))'
+
+    times = list()
+    loaded = ''
+    for _ in range(runs):
+        start = time.perf_counter()
+        proc = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)))
+        times.append(time.perf_counter() - start)
+        loaded = proc.stdout.strip()
+
+    best = min(times)
+    print(f'headless startup: {best * 1000:.0f} ms best of {runs}, budget {budget * 1000:.0f} ms, '
+          f'heavy modules: {loaded or "none"}')
+    if best > budget or loaded:
+        print('headless startup: REGRESSION')
+
+
+def bench_check(runs=20):
+    # sample check latency on the simulator, first check after connect and the ones after it
+    import contextlib
+    import io
+
+    import instrumentmanager
+
+    from simulator import AnalyzerSim, ProgrammerSim
+
+    print(f'sample check, {runs} runs')
+    for fast in [False, True]:
+        instrumentmanager.fast_check = fast
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            progr = ProgrammerSim()
+            manager = InstrumentManager()
+            manager.attach(AnalyzerSim(programmer=progr, seed=0), progr)
+
+            latencies = list()
+            for _ in range(runs):
+                manager.checkSample()
+                latencies.append(manager.check_latency)
+
+        label = 'fast' if fast else 'preset'
+        print(f'{label:>8}: first {latencies[0] * 1000:>6.1f} ms, then median {numpy.median(latencies[1:]) * 1000:>6.1f} ms, '
+              f'max {max(latencies[1:]) * 1000:>6.1f} ms')
+
+    instrumentmanager.fast_check = True
+
+
+def bench_acquisition(points=(51, 401, 1601), full=(False, True), out='bench_results.json'):
+    # one simulated sweep per grid, time per stage, per code and per sweep
+    import contextlib
+    import io
+    import json
+    import subprocess
+    import tempfile
+
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    import instrumentmanager
+
+    from simulator import AnalyzerSim, ProgrammerSim
+    from traceplot import TracePlot
+    from tracestore import TraceStore
+
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                  check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = ''
+
+    store = TraceStore(tempfile.mkdtemp(prefix='att_bench_'))
+    results = list()
+
+    for sweep_full in full:
+        for sweep_points in points:
+            instrumentmanager.full_sweep = sweep_full
+            serial = None
+
+            for sweep_pipelined in [False, True]:
+                instrumentmanager.pipelined = sweep_pipelined
+
+                # the manager logs every command, keep the report readable
+                with contextlib.redirect_stdout(io.StringIO()):
+                    progr = ProgrammerSim()
+                    manager = InstrumentManager(store=store)
+                    manager.attach(AnalyzerSim(programmer=progr, seed=0), progr)
+                    manager.measure_params = {0: dict(InstrumentManager.measure_params[0], points=sweep_points)}
+                    codes = len(manager.sweep_codes(0))
+
+                    manager.checkSample()
+                    manager.measure(0, chip='bench')
+
+                # PlotWidget redraws from the GUI thread, off the sweep's clock, so one full frame is timed apart
+                fig = Figure(figsize=(3, 2.5))
+                FigureCanvasAgg(fig)
+                plot = TracePlot(fig, 'title')
+                with manager._timer.stage('plot'):
+                    plot.update(repeat(manager._res_freqs), manager._res_normalized_att)
+                    plot.draw()
+                    fig.canvas.draw()
+
+                totals = manager._timer.totals()
+                per_code = manager._timer.per_code()
+                wall = totals['sweep'][1]
+                if serial is None:
+                    serial = wall
+
+                # stages nest and overlap, settle includes the transfers of its probe sweeps,
+                # a pipelined switch runs alongside the transfer
+                mode = 'pipelined' if sweep_pipelined else 'serial'
+                print(f'acquisition, {codes} codes, {sweep_points} points, {mode}: {wall:.3f} s/sweep, '
+                      f'{wall / codes * 1000:.1f} ms/code, {serial / wall:.2f}x serial')
+                for name, (calls, total) in sorted(totals.items(), key=lambda item: -item[1][1]):
+                    if name != 'sweep':
+                        print(f'{name:>12}: {total * 1000:>9.1f} ms, {total / wall * 100:>5.1f} %, {calls:>5} calls')
+
+                results.append({
+                    'codes': codes,
+                    'points': sweep_points,
+                    'pipelined': sweep_pipelined,
+                    'sweep': wall,
+                    'speedup': serial / wall,
+                    'stages': {name: {'calls': calls, 'total': total} for name, (calls, total) in totals.items()},
+                    'per_code': {str(code): stages for code, stages in per_code.items()},
+                    'bytes_read': manager._analyzer.bytes_read,
+                    'messages': manager._session.writes,
+                    'settings_skipped': manager._session.skipped,
+                    # code -> [sweeps, min, median, max] settle seconds
+                    'settle': {str(code): stats for code, stats in manager.settle.stats().items()},
+                })
+
+    instrumentmanager.full_sweep = False
+    instrumentmanager.pipelined = True
+    store.close()
+
+    with open(out, 'wt', encoding='utf-8') as f:
+        json.dump({'revision': revision, 'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+                   'python': sys.version.split()[0], 'numpy': numpy.__version__,
+                   'results': results}, f, indent=2)
+    print(f'acquisition results written to {out}')
+
+
+def bench_async(stations=2):
+    # simulated sweeps of several stations on one event loop, one by one and all at once, then a cancelled one
+    import asyncio
+    import contextlib
+    import io
+    import tempfile
+
+    from asyncinstruments import AsyncInstrumentManager
+    from simulator import AnalyzerSim, ProgrammerSim
+    from tracestore import TraceStore
+
+    store = TraceStore(tempfile.mkdtemp(prefix='att_bench_'))
+
+    def connect(seed):
+        progr = ProgrammerSim()
+        manager = AsyncInstrumentManager(store=store)
+        manager.attach(AnalyzerSim(programmer=progr, seed=seed), progr)
+        return manager
+
+    async def sweep(manager, index):
+        await manager.check_sample()
+        await manager.measure(0, chip=f'bench{index}')
+
+    async def run():
+        managers = [connect(seed) for seed in range(stations)]
+        # the first sweep after connect sets the analyzer up, it's not part of the comparison
+        await asyncio.gather(*(sweep(manager, 'warm') for manager in managers))
+
+        start = time.perf_counter()
+        for index, manager in enumerate(managers):
+            await sweep(manager, index)
+        one_by_one = time.perf_counter() - start
+
+        start = time.perf_counter()
+        await asyncio.gather(*(sweep(manager, index) for index, manager in enumerate(managers)))
+        together = time.perf_counter() - start
+
+        task = asyncio.ensure_future(sweep(managers[0], 'cancel'))
+        await asyncio.sleep(together / 4)
+        start = time.perf_counter()
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+        stopped = time.perf_counter() - start
+        codes = len(managers[0]._res_atts), len(managers[0]._res_codes)
+
+        for manager in managers:
+            manager.close()
+        return one_by_one, together, stopped, codes
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        one_by_one, together, stopped, codes = asyncio.run(run())
+    store.close()
+
+    print(f'async, {stations} stations: {one_by_one:.3f} s one by one, {together:.3f} s together, '
+          f'{one_by_one / together:.2f}x, cancel took {stopped * 1000:.1f} ms, {codes[0]} of {codes[1]} codes kept')
+
+
+def bench_phase(codes=64, points=1601, repeat=20):
+    # phase shift and group delay over a whole sweep at once, e.g. a stored one re-evaluated
+    import resultcube
+
+    rng = numpy.random.default_rng(0)
+    freqs = numpy.linspace(10e6, 8e9, points)
+    delays = 250e-12 + numpy.arange(codes)[:, numpy.newaxis] * 0.2e-12
+    s21 = rng.uniform(0.1, 1.0, (codes, points)) * numpy.exp(-2j * numpy.pi * freqs * delays)
+    cube = resultcube.make_cube(codes, points)
+    cube[:, resultcube.S21_RE] = s21.real
+    cube[:, resultcube.S21_IM] = s21.imag
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        phase = resultcube.phase(cube)
+        resultcube.phase_shift(phase, phase[0])
+        resultcube.group_delay(phase, freqs)
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f'phase, {codes} codes, {points} points: {elapsed * 1000:.1f} ms for shift and group delay')
+
+
+def bench_discovery(timeout=1.0):
+    # discovery against slow, silent and missing ports, every probe has to give up on time
+    import contextlib
+    import io
+
+    import discovery
+
+    print(f'discovery, {timeout:.1f} s timeout')
+    late = False
+    for port in ['COM1', 'SLOW', 'SILENT', 'COM7']:
+        start = time.perf_counter()
+        try:
+            found = discovery.probe_serial(port, timeout=timeout, serial_factory=FakeSerial)
+        except Exception as ex:
+            found = type(ex).__name__
+        elapsed = time.perf_counter() - start
+        # the last read may block for one port timeout past the deadline
+        late |= elapsed > timeout + 0.1
+        print(f'{port:>8}: {str(found):>16} in {elapsed * 1000:>6.0f} ms')
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        analyzer, port = discovery.discover(['E8362B'], timeout=timeout, serial_factory=FakeSerial,
+                                            rm=FakeResourceManager(), ports=['COM7', 'SILENT', 'SLOW', 'COM1'])
+    elapsed = time.perf_counter() - start
+    late |= elapsed > timeout * 2 + 1.1
+    print(f'discover: {analyzer[0] if analyzer else None}, {port} in {elapsed * 1000:.0f} ms')
+    if late:
+        print('discovery: TIMEOUT REGRESSION')
+
+
+def main(args):
+    bench_startup()
+    bench_transfer()
+    bench_discovery()
+    bench_telemetry()
+    bench_stations()
+    bench_plot()
+    bench_check()
+    bench_phase()
+    bench_async()
+    bench_acquisition()
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,88 @@
+import argparse
+import sys
+import time
+
+import evaluation
+import instrumentmanager
+
+from instrumentmanager import InstrumentManager
+from telemetry import CsvSink, LogSink
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description='Headless attenuator measurement')
+    parser.add_argument('--type', type=int, default=0, choices=sorted(InstrumentManager.measure_params),
+                        help='chip type')
+    parser.add_argument('--chip', help='chip id for the result store, timestamp by default')
+    backend = parser.add_mutually_exclusive_group()
+    backend.add_argument('--mock', action='store_true', help='use mock instruments')
+    backend.add_argument('--sim', action='store_true', help='use simulated instruments')
+    backend.add_argument('--live', action='store_true', help='use real instruments')
+    parser.add_argument('--full', action='store_true', help='sweep all 64 codes')
+    parser.add_argument('--rescan', action='store_true', help='ignore the instrument cache')
+    parser.add_argument('--check-only', action='store_true', help='only check sample presence')
+    parser.add_argument('--no-store', action='store_true', help='do not stream results to disk')
+    parser.add_argument('--telemetry', metavar='PATH', help='record instrument traffic, .csv or plain log')
+    opts = parser.parse_args(args[1:])
+
+    if opts.mock or opts.sim or opts.live:
+        instrumentmanager.mock_enabled = opts.mock
+        instrumentmanager.sim_enabled = opts.sim
+    if opts.full:
+        instrumentmanager.full_sweep = True
+    if opts.no_store:
+        instrumentmanager.store_path = None
+    if opts.telemetry:
+        instrumentmanager.telemetry_enabled = True
+
+    start = time.perf_counter()
+    manager = InstrumentManager()
+    if opts.telemetry:
+        sink = CsvSink(opts.telemetry) if opts.telemetry.endswith('.csv') else LogSink(opts.telemetry)
+        manager.telemetry.add_sink(sink)
+
+    try:
+        return run(manager, opts, start)
+    finally:
+        manager.telemetry.close()
+
+
+def run(manager, opts, start):
+    if not manager.findInstruments(rescan=opts.rescan):
+        print('instruments not found')
+        return 1
+    print(f'instruments: {", ".join(manager.getInstrumentNames())}')
+
+    present = manager.checkSample()
+    print(f'sample check: {manager.check_latency * 1000:.0f} ms')
+    if not present:
+        print('sample not detected')
+        return 2
+    if opts.check_only:
+        return 0
+
+    manager.measure(opts.type, chip=opts.chip)
+
+    limits = evaluation.standard[opts.type]
+    values, passed = evaluation.evaluate(manager._res_freqs, manager._res_cube, manager._res_atts, limits)
+    for label, rule, limit, value, ok in zip(evaluation.labels, evaluation.rules, limits, values, passed):
+        print(f'{label:>12}: {value:8.3f}  {rule} {limit:<6} {"ok" if ok else "FAIL"}')
+
+    settle = manager.settle.summary()
+    if settle is not None:
+        codes, median, p95, slowest, longest = settle
+        print(f'settle: {codes} codes, median {median * 1000:.1f} ms, 95% {p95 * 1000:.1f} ms, '
+              f'slowest code {slowest:06b} {longest * 1000:.1f} ms')
+
+    if manager.telemetry.enabled:
+        commands, size, elapsed = manager.telemetry.totals()
+        if elapsed:
+            print(f'sweep traffic: {commands} commands, {size / 1024:.0f} KiB, '
+                  f'{commands / elapsed:.0f} commands/s, {size / elapsed / 1024:.0f} KiB/s')
+
+    print(f'done in {time.perf_counter() - start:.1f} s')
+    return 0 if passed.all() else 3
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,118 @@
+import time
+
+from concurrent.futures import ThreadPoolExecutor, wait
+
+# '#NAME' -- the programmer answers with its name
+arduino_handshake = bytes([0x23, 0x4E, 0x41, 0x4D, 0x45])
+arduino_reply = b'ARDUINO'
+
+
+def list_serial_ports(brute_force=False):
+    if not brute_force:
+        try:
+            from serial.tools import list_ports
+            return [p.device for p in list_ports.comports()]
+        except ImportError:
+            pass
+    return [f'COM{i+1}' for i in range(256)]
+
+
+def probe_visa(rm, addr, models, timeout=2.0):
+    # returns (addr, idn, inst) for a known analyzer, None otherwise
+    print(f'trying {addr}')
+    inst = rm.open_resource(addr, open_timeout=int(timeout * 1000))
+    inst.timeout = int(timeout * 1000)
+    try:
+        idn = inst.query('*IDN?')
+        _, model, _, _ = idn.split(',')
+    except Exception:
+        inst.close()
+        raise
+
+    if model not in models:
+        inst.close()
+        return None
+
+    print(f'{model} found at {addr}')
+    return addr, idn.strip(), inst
+
+
+def verify_visa(rm, addr, idn, timeout=2.0):
+    # cheap reconnect check, the same unit must answer at the same address
+    inst = rm.open_resource(addr, open_timeout=int(timeout * 1000))
+    inst.timeout = int(timeout * 1000)
+    try:
+        if inst.query('*IDN?').strip() == idn:
+            return inst
+    except Exception as ex:
+        print(ex)
+
+    inst.close()
+    return None
+
+
+def probe_serial(port, baudrate=9600, timeout=1.0, serial_factory=None):
+    # returns the port if the programmer answers the handshake within timeout
+    import serial
+
+    if serial_factory is None:
+        serial_factory = serial.Serial
+
+    s = serial_factory(port=port, baudrate=baudrate, parity=serial.PARITY_NONE,
+                       bytesize=8, stopbits=serial.STOPBITS_ONE, timeout=0.05)
+    try:
+        s.write(arduino_handshake)
+
+        ans = b''
+        deadline = time.monotonic() + timeout
+        while arduino_reply not in ans and time.monotonic() < deadline:
+            # blocks for at most the port timeout, no spinning
+            ans += s.read(max(1, s.in_waiting))
+    finally:
+        s.close()
+
+    if arduino_reply in ans:
+        print(f'programmer found at {port}')
+        return port
+    return None
+
+
+def discover(models, brute_force=False, timeout=2.0, workers=32, serial_factory=None, rm=None, ports=None):
+    # probe all VISA resources and serial ports at once,
+    # returns ((addr, idn, inst) or None, port or None)
+    # rm, ports and serial_factory stand in for the hardware, e.g. in benchmark.py
+    if rm is None:
+        import visa
+        rm = visa.ResourceManager()
+    addrs = rm.list_resources()
+    if ports is None:
+        ports = list_serial_ports(brute_force)
+    print(f'available resources: {addrs}, ports: {ports}')
+
+    pool = ThreadPoolExecutor(max_workers=workers)
+    visa_futures = [pool.submit(probe_visa, rm, addr, models, timeout) for addr in addrs]
+    serial_futures = [pool.submit(probe_serial, port, 9600, timeout, serial_factory) for port in ports]
+
+    # every probe bounds itself, the overall wait only guards against a hung driver call
+    wait(visa_futures + serial_futures, timeout=timeout * 2 + 1)
+    pool.shutdown(wait=False, cancel_futures=True)
+
+    def results(futures, verbose):
+        for f in futures:
+            if not f.done() or f.cancelled():
+                continue
+            if f.exception() is not None:
+                if verbose:
+                    print(f.exception())
+                continue
+            if f.result() is not None:
+                yield f.result()
+
+    analyzers = list(results(visa_futures, verbose=True))
+    for _, _, inst in analyzers[1:]:
+        inst.close()
+
+    # most serial names don't exist at all, don't report those
+    port = next(results(serial_futures, verbose=False), None)
+
+    return (analyzers[0] if analyzers else None), port
@@ -0,0 +1,91 @@
+import numpy
+
+import resultcube
+
+labels = ['Att нач, дБ', 'Fнач, ГГц', 'Fкон, ГГц', 'Err амп, дБ', 'КСВ вх', 'КСВ вых']
+
+# chip type -> limits, same order as labels
+standard = {
+    0: [5, 0.01, 3, 1.0, 2.0, 2.0],
+    1: [15, 0.01, 10, 1.5, 2.0, 2.0]
+}
+
+# how a value is checked against its limit: '<' at most, '>' at least, '±' magnitude at most
+rules = ['<', '<', '>', '±', '<', '<']
+
+ATT = 0
+F_START = 1
+F_STOP = 2
+ERR = 3
+VSWR_IN = 4
+VSWR_OUT = 5
+
+# points the per-frequency error is reported at, evenly over the specified band
+spec_points = 101
+
+
+def vswr(s_db):
+    # reflection in dB -> VSWR, a reflection of 0 dB or more is reported as inf
+    gamma = numpy.power(10.0, numpy.asarray(s_db) / 20.0)
+    with numpy.errstate(divide='ignore'):
+        return numpy.where(gamma < 1.0, (1.0 + gamma) / (1.0 - gamma), numpy.inf)
+
+
+def passing_band(mask):
+    # first and last index of the longest run of True in mask, None if there's none
+    edges = numpy.diff(numpy.concatenate(([0], mask.astype(numpy.int8), [0])))
+    starts = numpy.flatnonzero(edges == 1)
+    stops = numpy.flatnonzero(edges == -1)
+    if not len(starts):
+        return None
+    longest = numpy.argmax(stops - starts)
+    return starts[longest], stops[longest] - 1
+
+
+def evaluate(freqs, cube, atts, limits):
+    # freqs in Hz, cube as in resultcube, atts nominal attenuation per cube row
+    # returns (values, passed), both in label order
+    freqs = numpy.asarray(freqs)
+    limits = numpy.asarray(limits, dtype=numpy.float64)
+
+    err = numpy.abs(resultcube.att_err_per_code(resultcube.normalized_att(cube), atts))
+    # worst code at every point
+    err_f = err.max(axis=0)
+    vswr_in_f = vswr(cube[:, resultcube.S11]).max(axis=0)
+    vswr_out_f = vswr(cube[:, resultcube.S22]).max(axis=0)
+    loss_f = -cube[0, resultcube.S21]
+
+    # specified band, falls back to the whole sweep if the grid doesn't cover it
+    band = (freqs >= limits[F_START] * 1e9) & (freqs <= limits[F_STOP] * 1e9)
+    if not band.any():
+        band = numpy.ones_like(freqs, dtype=bool)
+
+    # where the chip actually meets the spec
+    ok = (err_f <= limits[ERR]) & (vswr_in_f <= limits[VSWR_IN]) & (vswr_out_f <= limits[VSWR_OUT])
+    run = passing_band(ok)
+    f_start, f_stop = (freqs[run[0]] / 1e9, freqs[run[1]] / 1e9) if run is not None else (numpy.nan, numpy.nan)
+
+    values = numpy.array([
+        loss_f[band].max(),
+        f_start,
+        f_stop,
+        err_f[band].max(),
+        vswr_in_f[band].max(),
+        vswr_out_f[band].max(),
+    ])
+    return values, check(values, limits)
+
+
+def spec_freqs(limits, points=spec_points):
+    # Hz
+    return numpy.linspace(limits[F_START] * 1e9, limits[F_STOP] * 1e9, points)
+
+
+def check(values, limits):
+    # limits are inclusive, nan never passes
+    values = numpy.asarray(values)
+    limits = numpy.asarray(limits, dtype=numpy.float64)
+    below = values <= limits
+    above = values >= limits
+    within = numpy.abs(values) <= limits
+    return numpy.select([numpy.array(rules) == '<', numpy.array(rules) == '>'], [below, above], within)
@@ -0,0 +1,64 @@
+import numpy
+
+
+def interp_weights(grid, targets):
+    # (targets, points) matrix W, W @ trace is numpy.interp(targets, grid, trace):
+    # two neighbouring points per target, targets off the grid take the edge value
+    grid = numpy.asarray(grid, dtype=numpy.float64)
+    targets = numpy.asarray(targets, dtype=numpy.float64)
+    weights = numpy.zeros((len(targets), len(grid)))
+    if len(grid) == 1:
+        weights[:, 0] = 1.0
+        return weights
+
+    right = numpy.clip(numpy.searchsorted(grid, targets, side='right'), 1, len(grid) - 1)
+    left = right - 1
+    span = grid[right] - grid[left]
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        frac = numpy.where(span > 0, (targets - grid[left]) / span, 0.0)
+    frac = numpy.clip(frac, 0.0, 1.0)
+
+    rows = numpy.arange(len(targets))
+    weights[rows, left] = 1.0 - frac
+    weights[rows, right] += frac
+    return weights
+
+
+def interpolate(traces, weights):
+    # traces (..., points) onto the targets weights were made for, (..., targets), one matrix multiply
+    return traces @ weights.T
+
+
+class FreqAxis(object):
+    # stimulus grids as the analyzer reports them, read once per sweep setup,
+    # and interpolation weights onto spec frequencies, reused for every code and chip on that grid
+
+    def __init__(self):
+        self._grids = dict()
+        self._weights = dict()
+        # grids actually read off the analyzer
+        self.reads = 0
+
+    def grid(self, key, read):
+        # key is the sweep settings the grid follows from, read() asks the analyzer
+        grid = self._grids.get(key)
+        if grid is None:
+            grid = numpy.array(read(), dtype=numpy.float64)
+            grid.setflags(write=False)
+            self._grids[key] = grid
+            self.reads += 1
+        return grid
+
+    def weights(self, key, targets):
+        targets = numpy.asarray(targets, dtype=numpy.float64)
+        entry = (key, targets.tobytes())
+        weights = self._weights.get(entry)
+        if weights is None:
+            weights = interp_weights(self._grids[key], targets)
+            weights.setflags(write=False)
+            self._weights[entry] = weights
+        return weights
+
+    def clear(self):
+        self._grids.clear()
+        self._weights.clear()
@@ -0,0 +1,61 @@
+import json
+import os
+import time
+
+cache_file = 'instruments.json'
+cache_version = 1
+
+# a week between forced full scans even if the instruments keep answering
+max_age = 7 * 24 * 60 * 60
+
+
+class InstrumentCache(object):
+
+    def __init__(self, path=cache_file, max_age=max_age):
+        self._path = path
+        self._max_age = max_age
+
+    def load(self):
+        # last good instrument set or None if there's nothing usable
+        try:
+            with open(self._path, mode='rt', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError) as ex:
+            print(f'instrument cache: {ex}')
+            return None
+
+        if entry.get('version') != cache_version:
+            print('instrument cache: version mismatch')
+            return None
+
+        if time.time() - entry.get('saved', 0) > self._max_age:
+            print('instrument cache: expired')
+            return None
+
+        if not all(key in entry for key in ['addr', 'idn', 'port', 'baudrate']):
+            print('instrument cache: incomplete entry')
+            return None
+
+        return entry
+
+    def save(self, addr, idn, port, baudrate):
+        entry = {
+            'version': cache_version,
+            'saved': time.time(),
+            'addr': addr,
+            'idn': idn,
+            'port': port,
+            'baudrate': baudrate,
+        }
+        # write-then-rename, a crash never leaves a half-written cache
+        tmp = self._path + '.tmp'
+        with open(tmp, mode='wt', encoding='utf-8') as f:
+            json.dump(entry, f, indent=2)
+        os.replace(tmp, self._path)
+
+    def invalidate(self):
+        print('instrument cache: invalidate')
+        try:
+            os.remove(self._path)
+        except FileNotFoundError:
+            pass
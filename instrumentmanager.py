@@ -1,41 +1,87 @@
 import time
-from itertools import repeat
+import threading
 
 import numpy
-import visa
-import serial
 
+from concurrent.futures import ThreadPoolExecutor
 from os.path import isfile
-from functools import reduce
 
-from instr.agilente8362b import AgilentE8362B
-from instr.agilente8362bmock import AgilentE8362BMock
-from arduino.arduinoparallel import ArduinoParallel
-from arduino.arduinoparallelmock import ArduinoParallelMock
+import discovery
+import evaluation
+import freqaxis
+import resultcube
+
+from analyzerstates import AnalyzerStates
+from instrumentcache import InstrumentCache
+from scpisession import ScpiSession
+from settle import SettleDetector
+from stagetimer import StageTimer
+from telemetry import Telemetry, TracedInstrument
+from tracestore import shared_store
+
+# VISA, pyserial and the drivers are imported where they're used,
+# headless and mock runs never pay for the hardware stack
 
 # MOCK
 mock_enabled = True
+# simulated instruments with real data volume and timing, takes precedence over the mock
+sim_enabled = False
+# trace transfer format: 'real64', 'real32' or 'ascii'
+transfer_format = 'real64'
+# sweep all 64 attenuator states instead of the single-bit ones
+full_sweep = False
+# write the next code to the programmer while the current code's traces are read out
+pipelined = True
+# probe all instruments at once, brute-force COM1..COM256 only if the OS can't list ports
+parallel_discovery = True
+brute_force_ports = False
+# try the last good instrument addresses before a full scan
+discovery_cache = True
+# every sweep is streamed here as it is measured, None disables the store
+store_path = 'results'
+# skip analyzer settings that are already in place, join setup writes into one message
+scpi_cache = True
+scpi_batching = True
+# keep the analyzer setup in a state file on the analyzer and recall it instead of a preset
+state_recall = True
+state_file = 'att_measure.csa'
+# sample check without a preset, on a few points, stops at the first decisive sweep
+fast_check = True
+# record every SCPI command, code switch and trace read, see telemetry.py
+telemetry_enabled = False
+# ms the bulk read probe waits on a live analyzer, firmware without MFData never answers it
+bulk_probe_timeout = 2000
 # TODO 1,2,6,7 separate tab
-# TODO graph 8 -- all 64 codes
 # TODO 5,8 -- second tab
 
 class InstrumentManager(object):
 
+    # every setup has its own analyzer channel, switching between them needs no resend
     measure_params = {
         0: {
             'f1': 10_000_000,
             'f2': 8_000_000_000,
             'pow': -5,
-            'points': 1601
+            'points': 1601,
+            'chan': 1,
+            'settle_chan': 2
         },
         1: {
             'f1': 10_000_000,
             'f2': 15_000_000_000,
             'pow': -5,
-            'points': 1601
+            'points': 1601,
+            'chan': 4,
+            'settle_chan': 5
         },
     }
 
+    check_chan = 3
+    # mean S21 above the threshold means a sample is in, sweeps within the margin of it are repeated
+    check_threshold = -90.0
+    check_margin = 3.0
+    check_sweeps = 5
+
     level_codes = {
         0: {
             0.0:    0b111111,
@@ -59,258 +105,743 @@ class InstrumentManager(object):
         }
     }
 
-    def __init__(self):
+    # format name -> (FORMat:DATA argument, numpy dtype for the block payload)
+    data_formats = {
+        'ascii': ('ASCii,0', None),
+        'real32': ('REAL,32', '<f4'),
+        'real64': ('REAL,64', '<f8'),
+    }
+
+    def __init__(self, store=None):
         super().__init__()
-        print('instrument manager: init')
+        self._telemetry = Telemetry(enabled=telemetry_enabled)
+        self._telemetry.log('instrument manager: init')
 
-        self._analyzer: AgilentE8362BMock = None
-        self._progr: ArduinoParallelMock = None
+        self._analyzer: 'AgilentE8362BMock' = None
+        self._progr: 'ArduinoParallelMock' = None
+        # the pyvisa resource under a live analyzer
+        self._visa = None
 
         self._samplePresent = False
+        self._check_latency = 0.0
+
+        # the old mocks only produce 51 points and don't settle
+        self._fast_mock = False
+
+        self._format = None
+        self._bulk_mnums = dict()
+        self._session = None
+
+        # stimulus grids per sweep setup, and the grid of the current setup
+        self._freq_axis = freqaxis.FreqAxis()
+        self._grid_key = None
+
+        self._settle = SettleDetector(tolerance=0.05, max_delay=1.0)
+
+        self._cancel = threading.Event()
+
+        self._timer = StageTimer(self._telemetry)
+
+        self._cache = InstrumentCache()
+        self._states = AnalyzerStates(telemetry=self._telemetry)
+
+        # stations may share one store, it serializes the appends
+        self._store = store
 
         self._measure_data = list()
 
         self.analyzers = ['E8362B']
 
-        self._res_freqs = list()
-        self._res_baseline = list()
-        self._res_normalized_att = list()
-        self._res_s11 = list()
-        self._res_s22 = list()
+        self.clear_data()
 
-        self._res_att_err_per_freq = list()
-        self._res_att_err_per_code = list()
-        self._res_phase_shift = list()
-        self._res_att = list()
+    def findInstruments(self, rescan=False):
+        self._telemetry.log('instrument manager: find instruments')
 
-    def findInstruments(self):
-        print('instrument manager: find instruments')
+        baudrate = 9600
 
-        def find_com_ports():
-            for port in [f'COM{i+1}' for i in range(256)]:
-                try:
-                    s = serial.Serial(port)
-                    s.close()
-                    yield port
-                except (OSError, serial.SerialException):
-                    pass
+        def connect(idn, inst, port):
+            import serial
+            from instr.agilente8362b import AgilentE8362B
+            from arduino.arduinoparallel import ArduinoParallel
+
+            if inst is not None:
+                self._analyzer = AgilentE8362B(idn=idn, inst=inst)
+                self._visa = inst
+                # binary blocks need a raw read, the driver only wraps send/query
+                if not hasattr(self._analyzer, 'read_raw'):
+                    self._analyzer.read_raw = lambda: self.read_block(inst)
+            if port is not None:
+                self._progr = ArduinoParallel(port=port, baudrate=baudrate, parity=serial.PARITY_NONE,
+                                              bytesize=8, stopbits=serial.STOPBITS_ONE, timeout=1)
+            else:
+                self._telemetry.log('Arduino not found')
+
+        def find_cached():
+            import visa
+
+            entry = self._cache.load()
+            if entry is None:
+                return False
+
+            self._telemetry.log(f'trying cached instruments: {entry["addr"]}, {entry["port"]}')
+            try:
+                inst = discovery.verify_visa(visa.ResourceManager(), entry['addr'], entry['idn'])
+                if inst is None:
+                    raise ValueError(f'analyzer at {entry["addr"]} does not match cache')
+                if discovery.probe_serial(entry['port'], entry['baudrate']) is None:
+                    inst.close()
+                    raise ValueError(f'programmer at {entry["port"]} does not match cache')
+            except Exception as ex:
+                self._telemetry.log(ex)
+                self._cache.invalidate()
+                return False
+
+            connect(entry['idn'], inst, entry['port'])
+            return True
 
         def find_live():
-            # TODO refactor this mess
             # TODO error handling
+            import visa
+            import serial
+
+            addr, idn, inst, port = None, None, None, None
+
             rm = visa.ResourceManager()
             addrs = rm.list_resources()
-            print(f'available resources: {addrs}')
+            self._telemetry.log(f'available resources: {addrs}')
             for addr in addrs:
-                print(f'trying {addr}')
                 try:
-                    inst = rm.open_resource(addr)
-                    idn = inst.query('*IDN?')
-                    print(idn)
-                    _, model, _, _ = idn.split(',')
-                    if model in self.analyzers:
-                        self._analyzer = AgilentE8362B(idn=idn, inst=inst)
-                        print(f'{model} found at {addr}')
+                    found = discovery.probe_visa(rm, addr, self.analyzers)
+                    if found is not None:
+                        addr, idn, inst = found
                         break
                 except Exception as ex:
-                    print(ex)
+                    self._telemetry.log(ex)
 
-            try:
-                for port in find_com_ports():
-                    s = serial.Serial(port=port, baudrate=9600, parity=serial.PARITY_NONE,
-                                      bytesize=8, stopbits=serial.STOPBITS_ONE, timeout=1)
-                    if s.is_open:
-                        # s.write(b'LPF,1')
-                        s.write(bytes([0x23, 0x4E, 0x41, 0x4D, 0x45]))
-                        # time.sleep(0.5)
-                        while s.in_waiting == 0:
-                            pass
-                        ans = s.read_all()
-                        s.close()
-                        # if b'LPF is ' in ans:
-                        if b'ARDUINO' in ans:
-                            self._progr = ArduinoParallel(port=port, baudrate=9600, parity=serial.PARITY_NONE,
-                                                          bytesize=8, stopbits=serial.STOPBITS_ONE, timeout=1)
-                            break
-                else:
-                    raise ValueError('Arduino not found')
+            for candidate in discovery.list_serial_ports(brute_force_ports):
+                try:
+                    port = discovery.probe_serial(candidate, baudrate)
+                    if port is not None:
+                        break
+                except (OSError, serial.SerialException):
+                    pass
 
-            except Exception as ex:
-                print(ex)
+            return addr, idn, inst, port
+
+        def find_parallel():
+            found, port = discovery.discover(self.analyzers, brute_force=brute_force_ports)
+            addr, idn, inst = found if found is not None else (None, None, None)
+            return addr, idn, inst, port
+
+        def find_sim():
+            from simulator import AnalyzerSim, ProgrammerSim
+
+            self._progr = ProgrammerSim()
+            self._analyzer = AnalyzerSim(programmer=self._progr)
 
         def find_mocks():
+            import serial
+            from instr.agilente8362bmock import AgilentE8362BMock
+            from arduino.arduinoparallelmock import ArduinoParallelMock
+
             self._analyzer = AgilentE8362BMock(idn='Agilent,E8362B mock,sn,firmware')
             self._progr = ArduinoParallelMock(port='COM4', baudrate=9600, parity=serial.PARITY_NONE, bytesize=8,
                                               stopbits=serial.STOPBITS_ONE, timeout=1)
 
-        if mock_enabled:
+        self._format = None
+        self._bulk_mnums = dict()
+        self._visa = None
+        self._fast_mock = mock_enabled and not sim_enabled
+
+        if sim_enabled:
+            find_sim()
+        elif mock_enabled:
             find_mocks()
+        elif discovery_cache and not rescan and find_cached():
+            self._telemetry.log('instruments restored from cache')
         else:
-            find_live()
+            addr, idn, inst, port = find_parallel() if parallel_discovery else find_live()
+            connect(idn, inst, port)
+            if discovery_cache and inst is not None and port is not None:
+                self._cache.save(addr, idn, port, baudrate)
             # self._progr = ArduinoParallelMock(port='COM4', baudrate=115200, parity=serial.PARITY_NONE, bytesize=8,
             #                                   stopbits=serial.STOPBITS_ONE, timeout=1)
 
+        self._analyzer = self._traced(self._analyzer)
+        self._progr = self._traced(self._progr)
+        self._session = self._new_session()
+        self.check_states()
+
         return self._analyzer is not None and self._progr is not None
 
+    def _traced(self, inst):
+        if inst is None or isinstance(inst, TracedInstrument):
+            return inst
+        return TracedInstrument(inst, self._telemetry)
+
+    def _new_session(self):
+        if self._analyzer is None:
+            return None
+        # the old mocks answer one command per message
+        return ScpiSession(self._analyzer, cache=scpi_cache, batch=scpi_batching and not self._fast_mock)
+
+    @property
+    def telemetry(self):
+        return self._telemetry
+
+    def attach(self, analyzer, progr, fast_mock=False):
+        # use already connected instruments, e.g. when a station owns its pair
+        self._analyzer = self._traced(analyzer)
+        self._progr = self._traced(progr)
+        self._fast_mock = fast_mock
+        self._format = None
+        self._bulk_mnums = dict()
+        self._visa = None
+        self._session = self._new_session()
+        self.check_states()
+
+    def check_states(self):
+        self._states.catalog = set()
+        if not state_recall or self._session is None or self._fast_mock:
+            return
+        try:
+            self._states.check_catalog(self._session)
+        except Exception as ex:
+            # no mass storage access, every run starts from a preset
+            self._telemetry.log(f'analyzer states: {ex}')
+
+    def setup_state(self):
+        # start from the saved setup if there is one, from a preset otherwise,
+        # nothing to do while the session knows what the analyzer holds
+        if self._session.known:
+            return
+        if state_recall and self._states.recall(self._session, state_file):
+            self._format = None
+            self._bulk_mnums = dict()
+            return
+        self.preset()
+
+    def save_state(self):
+        if not state_recall or self._fast_mock:
+            return
+        # the setup goes out first, only a failed store is tolerated here
+        self._session.flush()
+        try:
+            self._states.store(self._session, state_file)
+        except Exception as ex:
+            self._telemetry.log(f'analyzer states: {ex}')
+
+    @classmethod
+    def full_codes(cls, params):
+        return resultcube.full_codes(cls.level_codes[params])
+
+    def sweep_codes(self, params):
+        return self.full_codes(params) if full_sweep else self.level_codes[params]
+
     def getInstrumentNames(self):
         return self._analyzer.name, self._progr.name
 
     def checkSample(self):
-        print('instrument manager: check sample')
-
-        # TODO implement sample check
-
-        chan = 1
-        points = 51
-        self._progr.set_lpf_code(0b100000)
-
-        if not mock_enabled:
-            time.sleep(1)
+        self._telemetry.log('instrument manager: check sample')
 
-        self._analyzer.send(f'SYSTem:FPRESet')
-        self._analyzer.send(f"CALCulate{chan}:PARameter:DEFine:EXT 'check_s21',S21")
-        self._analyzer.send(f'DISPlay:WINDow1:STATe ON')
-        self._analyzer.send(f"DISPlay:WINDow1:TRACe1:FEED 'check_s21'")
+        start = time.perf_counter()
 
-        self._analyzer.query(f'INITiate{chan}:CONTinuous OFF;*OPC?')
-        self._analyzer.send(f'SENSe{chan}:SWEep:TRIGger:POINt OFF')
+        chan = self.check_chan
+        points = 11 if fast_check else 51
+        code = 0b100000
 
-        self._analyzer.send(f'SOURce{chan}:POWer1 -5dbm')
-        self._analyzer.send(f'SENSe{chan}:FOM:RANGe1:SWEep:TYPE linear')
-        self._analyzer.send(f'SENSe{chan}:SWEep:POINts {points}')
-        self._analyzer.send(f'SENSe{chan}:FREQuency:STARt 10MHz')
-        self._analyzer.send(f'SENSe{chan}:FREQuency:STOP 8GHz')
+        session = self._session
+        if fast_check:
+            self.setup_state()
+        else:
+            self.preset()
+        self.setup_format()
 
-        self._analyzer.query(f'INITiate{chan};*OPC?')
+        session.set(f'CALCulate{chan}:PARameter:DEFine:EXT', '"check_s21",S21', key=f'CALCulate{chan}:check_s21')
+        session.set(f'DISPlay:WINDow{chan}:STATe', 'ON')
+        session.set(f'DISPlay:WINDow{chan}:TRACe1:FEED', '"check_s21"')
 
-        self._analyzer.send(f"CALCulate{chan}:PARameter:SELect 'check_s21'")
-        self._analyzer.send(f'FORMat ASCII')
+        session.set(f'SENSe{chan}:SWEep:TRIGger:POINt', 'OFF')
 
-        res = self._analyzer.query(f'CALCulate{chan}:DATA? FDATA')
+        session.set(f'SOURce{chan}:POWer1', '-5 dbm')
+        session.set(f'SENSe{chan}:FOM:RANGe1:SWEep:TYPE', 'linear')
+        session.set(f'SENSe{chan}:SWEep:POINts', points)
+        session.set(f'SENSe{chan}:FREQuency:STARt', 10_000_000)
+        session.set(f'SENSe{chan}:FREQuency:STOP', 8_000_000_000)
+        self.save_state()
 
-        avg = reduce(lambda a, b: a + b, map(float, res.split(',')), 0) / points
+        self._progr.set_lpf_code(code)
 
-        print(f'>>> avg level: {avg}')
+        if fast_check:
+            avg = self.check_level(chan, 'check_s21')
+        else:
+            if not self._fast_mock:
+                # the check channel's settle isn't booked under the sweep code it shares
+                self._settle.wait(lambda: self.sweep_trace(chan, 'check_s21'))
+            avg = numpy.mean(self.sweep_trace(chan, 'check_s21'))
 
         # if avg > -15:
         # if avg > -40:
-        if avg > -90:
-            self._samplePresent = True
-        else:
-            self._samplePresent = False
-
-        return self._samplePresent
+        self._samplePresent = bool(avg > self.check_threshold)
 
-    def clear_data(self):
-        self._res_freqs.clear()
-        self._res_baseline.clear()
-        self._res_normalized_att.clear()
-        self._res_s11.clear()
-        self._res_s22.clear()
+        self._check_latency = time.perf_counter() - start
+        self._telemetry.log(f'>>> avg level: {avg:.2f} dB, checked in {self._check_latency * 1000:.1f} ms')
 
-        self._res_att_err_per_freq.clear()
-        self._res_att_err_per_code.clear()
-        self._res_phase_shift.clear()
-        self._res_att.clear()
+        return self._samplePresent
 
-    def measure(self, params):
-        print(f'instrument manager: start measure {params}')
+    def check_level(self, chan, name):
+        # the level is far from the threshold either way unless the contact is bad or the switch
+        # is still moving, so one sweep decides almost always
+        avg = None
+        for _ in range(self.check_sweeps):
+            avg = numpy.mean(self.sweep_trace(chan, name))
+            if abs(avg - self.check_threshold) >= self.check_margin:
+                break
+        return avg
+
+    @property
+    def check_latency(self):
+        return self._check_latency
+
+    @property
+    def settle(self):
+        # settle times per code of every sweep so far, see SettleDetector.stats
+        return self._settle
+
+    def preset(self):
+        self._session.preset()
+        # preset drops the transfer format back to ASCII and deletes the measurements
+        self._format = None
+        self._bulk_mnums = dict()
 
+    def clear_data(self):
+        self._res_codes = dict()
+        self._res_atts = numpy.empty(0)
+        self._res_cube = resultcube.make_cube(0, 0)
+        self._res_freqs = numpy.empty(0)
+        self._res_spec_freqs = numpy.empty(0)
+        self._res_baseline = numpy.empty(0)
+        self._res_normalized_att = numpy.empty((0, 0))
+        self._res_s11 = numpy.empty((0, 0))
+        self._res_s22 = numpy.empty((0, 0))
+
+        self._res_att_err_per_freq = numpy.empty(0)
+        self._res_att_err_per_code = numpy.empty((0, 0))
+        self._res_phase_shift = numpy.empty((0, 0))
+        self._res_group_delay = numpy.empty((0, 0))
+        self._res_att = numpy.empty((0, 0))
+        self._res_settle = dict()
+
+        self._sweep_atts = numpy.empty(0)
+        self._sweep_cube = resultcube.make_cube(0, 0)
+        self._sweep_phase = numpy.empty((0, 0))
+        self._sweep_phase_shift = numpy.empty((0, 0))
+        self._sweep_group_delay = numpy.empty((0, 0))
+        self._spec_weights = numpy.empty((0, 0))
+
+    def measure(self, params, progress=None, chip=None):
+        # progress(done, total) is called after every code, from the measuring thread
+        self._telemetry.log(f'instrument manager: start measure {params}')
+
+        if chip is None:
+            chip = time.strftime('%Y%m%d-%H%M%S')
+
+        self._cancel.clear()
+        self._timer.clear()
+        self._telemetry.clear()
         self.clear_data()
 
-        self.measureTask(params)
+        with self._timer.stage('sweep'):
+            self.measureTask(params, progress, chip)
 
-        print('instrument manager: end measure')
+        elapsed = self._timer.totals()['sweep'][1]
+        self._telemetry.log(f'instrument manager: end measure, {elapsed:.2f} s {"pipelined" if pipelined else "serial"}')
 
-    def measure_code(self, chan, name):
-        print('measure param', name)
-        self._analyzer.send(f'CALCulate{chan}:PARameter:SELect "{name}"')
-        self._analyzer.send(f'FORMat ASCII')
-        return self._analyzer.query(f'CALCulate{chan}:DATA? FDATA')
-
-    def parse_measure_string(self, string: str):
-        return [float(point) for point in string.split(',')]
+    def cancel(self):
+        # checked between codes, the current code is finished first
+        self._telemetry.log('instrument manager: cancel measure')
+        self._cancel.set()
 
-    def measureTask(self, params):
-        print(f'measurement task run {params}')
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
 
-        chan = 1
-        port = 1
-        s21_name = 'meas_s21'
-        s11_name = 'meas_s11'
-        s22_name = 'meas_s22'
+    def setup_format(self):
+        # binary transfer needs raw reads from the driver, otherwise stay on ASCII
+        fmt = transfer_format if hasattr(self._analyzer, 'read_raw') else 'ascii'
+        if fmt == self._format:
+            return
 
-        meas_pow = self.measure_params[params]['pow']
-        meas_f1 = self.measure_params[params]['f1']
-        meas_f2 = self.measure_params[params]['f2']
-        points = self.measure_params[params]['points']
+        if fmt != transfer_format:
+            self._telemetry.log(f'analyzer driver has no raw read, {transfer_format} transfer falls back to ascii')
+        self._telemetry.log(f'trace transfer format: {fmt}')
+        self._session.set('FORMat:DATA', self.data_formats[fmt][0])
+        if fmt != 'ascii':
+            self._session.set('FORMat:BORDer', 'SWAPped')
+        self._format = fmt
 
-        if mock_enabled:
-            points = 51
+    def measure_code(self, chan, name):
+        self._telemetry.debug(f'measure param {name}')
+        self._session.set(f'CALCulate{chan}:PARameter:SELect', f'"{name}"')
+        return self.read_trace(f'CALCulate{chan}:DATA? FDATA')
+
+    def setup_bulk(self, chan, names, points):
+        # CALCulate:DATA:MFData? returns several measurements in one reply,
+        # older PNA firmware doesn't know it -- probe once per channel and remember
+        if chan in self._bulk_mnums:
+            return bool(self._bulk_mnums[chan])
+
+        self._bulk_mnums[chan] = ''
+        timeout = self._visa.timeout if self._visa is not None else None
+        try:
+            mnums = list()
+            for name in names:
+                self._session.set(f'CALCulate{chan}:PARameter:SELect', f'"{name}"')
+                mnums.append(str(int(self._session.query(f'CALCulate{chan}:PARameter:MNUMber?'))))
+            mnums = ','.join(mnums)
+
+            self._session.queue('*CLS')
+            if timeout is not None:
+                self._visa.timeout = bulk_probe_timeout
+            data = self.read_trace(f'CALCulate{chan}:DATA:MFData? "{mnums}"')
+            err = self._session.query('SYSTem:ERRor?')
+            if len(data) == len(names) * points and err.strip().startswith(('+0', '0')):
+                self._bulk_mnums[chan] = mnums
+        except Exception as ex:
+            self._telemetry.log(ex)
+        finally:
+            if timeout is not None:
+                self._visa.timeout = timeout
+
+        if not self._bulk_mnums[chan]:
+            # the rejected header is still in the error queue, the next sync would take it for a lost setting
+            self._session.queue('*CLS')
+
+        self._telemetry.log(f'bulk trace read: {"supported" if self._bulk_mnums[chan] else "not supported"}')
+        return bool(self._bulk_mnums[chan])
+
+    def measure_code_bulk(self, chan, names):
+        self._telemetry.debug(f'measure params {names}')
+        # one row per measurement, reshape is a view over the received block
+        return self.read_trace(f'CALCulate{chan}:DATA:MFData? "{self._bulk_mnums[chan]}"').reshape(len(names), -1)
+
+    def sweep(self, chan):
+        # single sweep on one channel, returns when it's done, the other channels keep their trigger mode
+        # sweep mode is never cached, a single sweep leaves the channel on hold
+        self._session.query(f'SENSe{chan}:SWEep:MODE SINGle;*OPC?')
+
+    def sweep_trace(self, chan, name):
+        self.sweep(chan)
+        self._session.set(f'CALCulate{chan}:PARameter:SELect', f'"{name}"')
+        return self.read_trace(f'CALCulate{chan}:DATA? FDATA')
+
+    def setup_settle(self, chan, name, power, f1, f2, points=11):
+        # low-point S21 probe channel used to detect when the attenuator has settled
+        session = self._session
+        session.set(f'CALCulate{chan}:PARameter:DEFine:EXT', f'"{name}",S21', key=f'CALCulate{chan}:{name}')
+        session.queue(f'SENSe{chan}:SWEep:MODE HOLD')
+        session.set(f'SOURce{chan}:POWer1', f'{power} dbm')
+        session.set(f'SENSe{chan}:FOM:RANGe1:SWEep:TYPE', 'linear')
+        session.set(f'SENSe{chan}:SWEep:POINts', points)
+        session.set(f'SENSe{chan}:FREQuency:STARt', f1)
+        session.set(f'SENSe{chan}:FREQuency:STOP', f2)
+
+    def read_trace(self, question):
+        if self._format is None or self._format == 'ascii':
+            with self._timer.stage('transfer'):
+                reply = self._session.query(question)
+            with self._timer.stage('parse'):
+                return self.parse_measure_string(reply)
+
+        with self._timer.stage('transfer'):
+            self._session.write(question)
+            reply = self._analyzer.read_raw()
+        with self._timer.stage('parse'):
+            return self.parse_measure_block(reply, self.data_formats[self._format][1])
+
+    @staticmethod
+    def parse_measure_string(string: str):
+        return numpy.array(string.split(','), dtype=float)
+
+    @staticmethod
+    def parse_measure_block(block: bytes, dtype):
+        # IEEE 488.2 definite-length block: #<n><n-digit length><payload>[\n]
+        if block[:1] != b'#':
+            raise ValueError(f'not a binary block: {block[:16]}')
+
+        digits = int(block[1:2])
+        if digits == 0:
+            # indefinite-length block, payload runs up to the terminator, which is one byte at most
+            offset = 2
+            length = len(block) - offset - block.endswith(b'\n')
+        else:
+            offset = 2 + digits
+            length = int(block[2:offset])
+
+        if len(block) < offset + length or length % numpy.dtype(dtype).itemsize:
+            raise ValueError(f'binary block cut short: {len(block) - offset} of {length} payload bytes')
+
+        # read-only view over the received buffer, no copy
+        return numpy.frombuffer(block, dtype=dtype, count=length // numpy.dtype(dtype).itemsize, offset=offset)
+
+    @staticmethod
+    def read_block(inst):
+        # one block off a pyvisa resource: the payload is read by its length with termchar breaks off,
+        # a 0x0A inside it would end a plain read_raw early
+        head = inst.read_bytes(2)
+        digits = int(head[1:2])
+        if digits == 0:
+            # indefinite-length, only END tells where it stops
+            return head + inst.read_raw()
+        size = inst.read_bytes(digits)
+        payload = inst.read_bytes(int(size), break_on_termchar=False)
+        # the message terminator after the block
+        inst.read_bytes(1)
+        return head + size + payload
+
+    def measureTask(self, params, progress=None, chip=''):
+        self._telemetry.log(f'measurement task run {params}')
+
+        with self._timer.stage('setup'):
+            chan, names, bulk, settle = self.setup_measure(params)
+        items, sweep = self.begin_results(params, chip)
+
+        measured = 0
+
+        def switch(code):
+            with self._timer.stage('switch', code=code):
+                self._progr.set_lpf_code(code)
+
+        # the programmer and the analyzer are on separate buses, one write ahead is enough
+        writer = ThreadPoolExecutor(max_workers=1) if pipelined else None
+        pending = None
+
+        try:
+            for index, (label, code) in enumerate(items):
+                if self._cancel.is_set():
+                    self._telemetry.log(f'measurement task aborted at code {code}')
+                    break
+
+                self._timer.code = self._telemetry.code = code
+                self._telemetry.debug(f'setting value={label} code={code}')
+                if pending is None:
+                    switch(code)
+                else:
+                    # whatever part of the write the readout didn't cover
+                    with self._timer.stage('switch wait'):
+                        pending.result()
+                    pending = None
 
-        # self._analyzer.send(f'SYSTem:FPRESet')
+                self.settle_code(code, settle)
 
-        self._analyzer.send(f'CALCulate{chan}:PARameter:DEFine:EXT "{s21_name}",S21')
-        self._analyzer.send(f'CALCulate{chan}:PARameter:DEFine:EXT "{s11_name}",S11')
-        self._analyzer.send(f'CALCulate{chan}:PARameter:DEFine:EXT "{s22_name}",S22')
-        self._analyzer.send(f'DISPlay:WINDow1:TRACe1:DELete')
-        self._analyzer.send(f'DISPlay:WINDow1:TRACe1:FEED "{s21_name}"')
-        self._analyzer.send(f'DISPlay:WINDow1:TRACe2:FEED "{s11_name}"')
-        self._analyzer.send(f'DISPlay:WINDow1:TRACe3:FEED "{s22_name}"')
+                with self._timer.stage('trigger'):
+                    self.sweep(chan)
 
-        self._analyzer.query(f'INITiate{chan}:CONTinuous ON;*OPC?')
+                if writer is not None and index + 1 < len(items):
+                    # this code's traces are held by the analyzer now, the next write can't spoil them
+                    pending = writer.submit(switch, items[index + 1][1])
 
-        self._analyzer.send(f'SOURce{chan}:POWer{port} {meas_pow} dbm')
-        self._analyzer.send(f'SENSe{chan}:FOM:RANGe1:SWEep:TYPE linear')
-        self._analyzer.send(f'SENSe{chan}:SWEep:POINts {points}')
-        self._analyzer.send(f'SENSe{chan}:FREQuency:STARt {meas_f1}')
-        self._analyzer.send(f'SENSe{chan}:FREQuency:STOP {meas_f2}')
+                self._sweep_cube[index] = self.read_code(chan, names, bulk)
 
-        s21s = list()
-        s11s = list()
-        s22s = list()
+                measured = self.finish_code(sweep, index, label, code, progress)
+        finally:
+            if writer is not None:
+                # a write still in flight on abort is let to finish
+                writer.shutdown(wait=True)
 
-        for label, code in list(self.level_codes[params].items()):
-            print(f'setting value={label} code={code}')
-            self._progr.set_lpf_code(code)
+        self.end_results(sweep, measured)
 
-            if not mock_enabled:
-                time.sleep(1)
+    def setup_measure(self, params):
+        # analyzer setup for a chip type, returns what the code loop needs:
+        # measurement channel, trace names, bulk read support and the settle probe (None without one)
+        chan = self.measure_params[params]['chan']
+        port = 1
+        settle_chan = self.measure_params[params]['settle_chan']
+        settle_name = f'settle{settle_chan}_s21'
+        # measurement names are unique across channels
+        s21_name = f'meas{chan}_s21'
+        s11_name = f'meas{chan}_s11'
+        s22_name = f'meas{chan}_s22'
 
-            self._analyzer.send(f'TRIG:SCOP CURRENT')
+        meas_pow = self.measure_params[params]['pow']
+        meas_f1 = self.measure_params[params]['f1']
+        meas_f2 = self.measure_params[params]['f2']
+        points = self.measure_points(params)
 
-            s21s.append(self.parse_measure_string(self.measure_code(chan, s21_name)))
-            s11s.append(self.parse_measure_string(self.measure_code(chan, s11_name)))
-            s22s.append(self.parse_measure_string(self.measure_code(chan, s22_name)))
+        # self._analyzer.send(f'SYSTem:FPRESet')
 
-        # gen freq data
-        # TODO: read off PNA
-        self._res_freqs = list(numpy.linspace(meas_f1, meas_f2, points))
+        session = self._session
+        self.setup_state()
+
+        for name, sparam in [(s21_name, 'S21'), (s11_name, 'S11'), (s22_name, 'S22')]:
+            session.set(f'CALCulate{chan}:PARameter:DEFine:EXT', f'"{name}",{sparam}', key=f'CALCulate{chan}:{name}')
+        session.set(f'DISPlay:WINDow{chan}:STATe', 'ON')
+        session.set(f'DISPlay:WINDow{chan}:TRACe1:FEED', f'"{s21_name}"')
+        session.set(f'DISPlay:WINDow{chan}:TRACe2:FEED', f'"{s11_name}"')
+        session.set(f'DISPlay:WINDow{chan}:TRACe3:FEED', f'"{s22_name}"')
+
+        session.set(f'INITiate{chan}:CONTinuous', 'ON')
+        # every code gets its own single sweep, the channel stays on hold in between
+        session.queue(f'SENSe{chan}:SWEep:MODE HOLD')
+
+        session.set(f'SOURce{chan}:POWer{port}', f'{meas_pow} dbm')
+        session.set(f'SENSe{chan}:FOM:RANGe1:SWEep:TYPE', 'linear')
+        session.set(f'SENSe{chan}:SWEep:POINts', points)
+        session.set(f'SENSe{chan}:FREQuency:STARt', meas_f1)
+        session.set(f'SENSe{chan}:FREQuency:STOP', meas_f2)
+
+        session.set(f'TRIGger:SCOPe', 'CURRent')
+
+        self.setup_format()
+        names = [s21_name, s11_name, s22_name]
+        # S21 comes from SDATA, the bulk read is for the reflections
+        bulk = self.setup_bulk(chan, names[1:], points)
+
+        settle = None
+        if not self._fast_mock:
+            self.setup_settle(settle_chan, settle_name, meas_pow, meas_f1, meas_f2)
+            settle = settle_chan, settle_name
+
+        self.save_state()
+
+        # one sync for the whole setup
+        session.sync()
+
+        self._grid_key = (self._states.idn, chan, meas_f1, meas_f2, points)
+        self.read_freqs(chan, meas_f1, meas_f2, points)
+
+        return chan, names, bulk, settle
+
+    def read_freqs(self, chan, f1, f2, points):
+        # the analyzer's stimulus grid, read once per sweep settings, the old mocks don't report one
+        if self._fast_mock:
+            return self._freq_axis.grid(self._grid_key, lambda: numpy.linspace(f1, f2, points))
+
+        def read():
+            with self._timer.stage('freqs'):
+                return self.read_trace(f'SENSe{chan}:X?')
+        return self._freq_axis.grid(self._grid_key, read)
+
+    def measure_points(self, params):
+        # the old mocks only produce 51 points
+        return 51 if self._fast_mock else self.measure_params[params]['points']
+
+    def begin_results(self, params, chip):
+        # empty result cube for the sweep plus its store entry, returns the (label, code) list to measure
+        points = self.measure_points(params)
+
+        # grid read at setup, the per-frequency error goes onto the spec frequencies
+        self._res_freqs = self._freq_axis.grid(self._grid_key, None)
+        limits = evaluation.standard.get(params)
+        self._res_spec_freqs = self._res_freqs if limits is None else evaluation.spec_freqs(limits)
+        self._spec_weights = self._freq_axis.weights(self._grid_key, self._res_spec_freqs)
+
+        codes = self.sweep_codes(params)
+        self._res_codes = codes
+
+        # filled code by code, results so far are views over the measured part
+        self._sweep_atts = numpy.fromiter(codes.keys(), dtype=numpy.float64, count=len(codes))
+        self._sweep_cube = resultcube.make_cube(len(codes), points)
+        self._sweep_phase = numpy.empty((len(codes), points))
+        self._sweep_phase_shift = numpy.empty((len(codes), points))
+        self._sweep_group_delay = numpy.empty((len(codes), points))
+
+        if self._store is None and store_path is not None:
+            self._store = shared_store(store_path)
+
+        sweep = None
+        if self._store is not None:
+            sweep = self._store.begin_sweep(chip, params, self._res_freqs, sparams=len(resultcube.sparams))
+
+        return list(codes.items()), sweep
+
+    def settle_code(self, code, settle):
+        if settle is None:
+            return
+        settle_chan, settle_name = settle
+        with self._timer.stage('settle'):
+            self._res_settle[code] = self._settle.wait(lambda: self.sweep_trace(settle_chan, settle_name), code)
+        self._telemetry.debug(f'settled in {self._res_settle[code]:.3f} s')
+
+    def read_code(self, chan, names, bulk):
+        # (sparams, points) of the last sweep: S21 is read unformatted and its dB row follows from it,
+        # the reflections are read formatted
+        s21 = self.measure_complex(chan, names[0])
+        if bulk:
+            reflections = self.measure_code_bulk(chan, names[1:])
+        else:
+            reflections = numpy.stack([self.measure_code(chan, name) for name in names[1:]])
+        with numpy.errstate(divide='ignore'):
+            s21_db = 20 * numpy.log10(numpy.hypot(s21[0], s21[1]))
+        return numpy.concatenate((s21_db[numpy.newaxis], reflections, s21))
+
+    def measure_complex(self, chan, name):
+        # (2, points) real and imaginary rows, SDATA comes as interleaved pairs
+        if self._fast_mock:
+            # the old mocks have no unformatted data, magnitude at zero phase
+            fdata = self.measure_code(chan, name)
+            return numpy.stack((numpy.power(10.0, fdata / 20.0), numpy.zeros_like(fdata)))
+        self._session.set(f'CALCulate{chan}:PARameter:SELect', f'"{name}"')
+        return self.read_trace(f'CALCulate{chan}:DATA? SDATA').reshape(-1, 2).T
+
+    def finish_code(self, sweep, index, label, code, progress=None):
+        # code at index is in the sweep cube, store it, update the results, returns how many codes are done
+        cube = self._sweep_cube
+        atts = self._sweep_atts
+
+        if sweep is not None:
+            with self._timer.stage('store'):
+                self._store.append_code(sweep, code, label, cube[index])
+
+        self._res_atts = atts[:index + 1]
+        self._res_cube = cube[:index + 1]
+        with self._timer.stage('calc'):
+            self.calc_phase(index)
+            self.calc_results()
+
+        if progress is not None:
+            progress(index + 1, len(cube))
+        return index + 1
+
+    def end_results(self, sweep, measured):
+        self._timer.code = self._telemetry.code = None
+        if sweep is not None:
+            self._store.end_sweep(sweep, complete=measured == len(self._res_codes))
+
+    def calc_phase(self, index):
+        # phase shift and group delay only depend on the code itself and the baseline,
+        # every code is computed once as it comes in
+        phase = resultcube.phase(self._sweep_cube[index:index + 1])[0]
+        self._sweep_phase[index] = phase
+        self._sweep_phase_shift[index] = resultcube.phase_shift(phase, self._sweep_phase[0])
+        self._sweep_group_delay[index] = resultcube.group_delay(phase, self._res_freqs)
+
+    def calc_results(self):
+        cube = self._res_cube
 
         # calc baseline
-        self._res_baseline = s21s[0]
+        self._res_baseline = cube[0, resultcube.S21]
 
         # calc normalized attenuation
-        self._res_normalized_att = list()
-        for s21 in s21s:
-            self._res_normalized_att.append([s - b for s, b in zip(s21, self._res_baseline)])
+        self._res_normalized_att = resultcube.normalized_att(cube)
 
         # calc S11, S22
-        self._res_s11 = s11s
-        self._res_s22 = s22s
+        self._res_s11 = cube[:, resultcube.S11]
+        self._res_s22 = cube[:, resultcube.S22]
 
         # calc attenuation error per code
-        for data, att in zip(self._res_normalized_att, self.level_codes[params].keys()):
-            self._res_att_err_per_code.append([d + c for d, c in zip(data, repeat(att, len(data)))])
+        self._res_att_err_per_code = resultcube.att_err_per_code(self._res_normalized_att, self._res_atts)
 
-        # calc attenuation error per freq - ?
-        # how to chose freqs?
-        # interpolate data between setting points or simply connect points?
+        # calc attenuation error per freq, worst code at each spec frequency
+        self._res_att_err_per_freq = resultcube.att_err_per_freq(
+            freqaxis.interpolate(self._res_att_err_per_code, self._spec_weights))
 
-        # calc phase shift
+        # calc phase shift, S21 phase of every code against the baseline, and group delay, see calc_phase
+        self._res_phase_shift = self._sweep_phase_shift[:len(cube)]
+        self._res_group_delay = self._sweep_group_delay[:len(cube)]
 
         # calc attenuation
-        self._res_att = s21s
+        self._res_att = cube[:, resultcube.S21]
 
 # калибровка 1 рез перед измерением
 # sweep->sweep type->linear freq->start 10 MHz
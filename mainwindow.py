@@ -1,8 +1,9 @@
 from PyQt5 import uic
-from PyQt5.QtWidgets import QMainWindow, QMessageBox
-from PyQt5.QtCore import Qt, pyqtSignal, pyqtSlot
+from PyQt5.QtWidgets import QLabel, QMainWindow, QMessageBox
+from PyQt5.QtCore import Qt, QThread, QTimer, pyqtSignal, pyqtSlot
 
 from instrumentmanager import InstrumentManager
+from measureworker import MeasureWorker
 from mytools.mapmodel import MapModel
 from measuremodel import MeasureModel
 from plotwidget import PlotWidget
@@ -14,7 +15,7 @@ class MainWindow(QMainWindow):
     sampleFound = pyqtSignal()
     measurementFinished = pyqtSignal(int)
 
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, asynchronous=False):
         super().__init__(parent)
 
         self.setAttribute(Qt.WA_QuitOnClose)
@@ -24,7 +25,13 @@ class MainWindow(QMainWindow):
         self._ui = uic.loadUi('mainwindow.ui', self)
 
         # create models
-        self._instrumentManager = InstrumentManager()
+        # with an asyncio loop on top of Qt (measure.py --async) the sweep is a task on the GUI thread
+        if asynchronous:
+            from asyncinstruments import AsyncInstrumentManager
+            self._instrumentManager = AsyncInstrumentManager()
+        else:
+            self._instrumentManager = InstrumentManager()
+        self._asynchronous = asynchronous
         self._measureModel = MeasureModel(parent=self, instrumentManager=self._instrumentManager)
 
         self._chipModel = MapModel(parent=self, data={0: '1324ПМ1 (0,25 дБ)', 1: '1324ПМ2 (0,5 дБ)'})
@@ -33,6 +40,19 @@ class MainWindow(QMainWindow):
         self._plotWidget = PlotWidget(parent=self, instrumentManager=self._instrumentManager)
         self._ui.grpPlot.setLayout(self._plotWidget)
 
+        self._measureThread = None
+        self._measureWorker = None
+        self._measureTask = None
+
+        # live instrument traffic, only when telemetry is on
+        self._lblTraffic = QLabel(parent=self)
+        self._trafficTimer = QTimer(self)
+        self._trafficTimer.setInterval(1000)
+        self._trafficTimer.timeout.connect(self.updateTraffic)
+        if self._instrumentManager.telemetry.enabled:
+            self._ui.statusbar.addPermanentWidget(self._lblTraffic)
+            self._trafficTimer.start()
+
         self.initDialog()
 
     def setupUiSignals(self):
@@ -93,6 +113,10 @@ class MainWindow(QMainWindow):
         self._ui.btnMeasureStart.setVisible(False)
         self._ui.btnMeasureStop.setVisible(True)
 
+    def updateTraffic(self):
+        commands, size = self._instrumentManager.telemetry.rates()
+        self._lblTraffic.setText(f'Команд/с: {commands:.0f}, КБ/с: {size / 1024:.0f}')
+
     def collectParams(self):
         chip_type = self._ui.comboChip.currentData(MapModel.RoleNodeId)
         return chip_type
@@ -133,6 +157,7 @@ class MainWindow(QMainWindow):
                 return
         except Exception as ex:
             print(ex)
+        self._ui.statusbar.showMessage(f'Образец найден, проверка {self._instrumentManager.check_latency * 1000:.0f} мс')
         self.modeReadyToMeasure()
         self.sampleFound.emit()
         self.refreshView()
@@ -148,16 +173,83 @@ class MainWindow(QMainWindow):
 
         self.modeMeasureInProgress()
         params = self.collectParams()
-        self._instrumentManager.measure(params)
-        self.measurementFinished.emit(params)
-        self.modeMeasureFinished()
-        self.refreshView()
+
+        if self._asynchronous:
+            import asyncio
+            self._measureTask = asyncio.ensure_future(self.measureAsync(params))
+            return
+
+        self._measureThread = QThread(self)
+        self._measureWorker = MeasureWorker(instrumentManager=self._instrumentManager, params=params)
+        self._measureWorker.moveToThread(self._measureThread)
+
+        self._measureThread.started.connect(self._measureWorker.run)
+        self._measureWorker.codeMeasured.connect(self.on_codeMeasured)
+        self._measureWorker.measureFailed.connect(self.on_measureFailed)
+        self._measureWorker.measureFailed.connect(self._measureThread.quit)
+        self._measureWorker.measureFinished.connect(self.on_measureFinished)
+        self._measureWorker.measureFinished.connect(self._measureThread.quit)
+        self._measureThread.finished.connect(self._measureWorker.deleteLater)
+        self._measureThread.finished.connect(self._measureThread.deleteLater)
+
+        self._measureThread.start()
 
     @pyqtSlot()
     def on_btnMeasureStop_clicked(self):
-        # TODO implement
+        if self._measureThread is None and self._measureTask is None:
+            self.modeCheckSample()
+            return
+
         print('abort measurement task')
+        self._ui.btnMeasureStop.setEnabled(False)
+        self._instrumentManager.cancel()
+        if self._measureTask is not None:
+            # don't wait for the rest of the code, the instrument call in flight still completes
+            self._measureTask.cancel()
+
+    async def measureAsync(self, params):
+        import asyncio
+        try:
+            await self._instrumentManager.measure(params, progress=self.on_codeMeasured)
+        except asyncio.CancelledError:
+            pass
+        except Exception as ex:
+            print(ex)
+            self.on_measureFailed(str(ex))
+            return
+        self.on_measureFinished(params)
+
+    @pyqtSlot(int, int)
+    def on_codeMeasured(self, done, total):
+        self._ui.statusbar.showMessage(f'Измерено состояний: {done} из {total}')
+        self._plotWidget.updatePlot()
+
+    def resetMeasure(self):
+        self._measureThread = None
+        self._measureWorker = None
+        self._measureTask = None
+        self._ui.btnMeasureStop.setEnabled(True)
+
+    @pyqtSlot(str)
+    def on_measureFailed(self, message):
+        # a partial sweep is neither shown nor evaluated
+        self.resetMeasure()
+        self._ui.statusbar.showMessage('Измерение не удалось')
         self.modeCheckSample()
+        self.failWith(message)
+
+    @pyqtSlot(int)
+    def on_measureFinished(self, params):
+        self.resetMeasure()
+
+        if self._instrumentManager.cancelled:
+            self._ui.statusbar.showMessage('Измерение прервано')
+            self.modeCheckSample()
+            return
+
+        self.measurementFinished.emit(params)
+        self.modeMeasureFinished()
+        self.refreshView()
 
     @pyqtSlot()
     def on_btnReport_clicked(self):
@@ -1,12 +1,35 @@
-import subprocess
 import sys
 
-from PyQt5.QtWidgets import QApplication
-from mainwindow import MainWindow
 
+def main(args):
+    # forget the last good instrument set, the next search does a full scan
+    if '--rescan' in args:
+        from instrumentcache import InstrumentCache
+        InstrumentCache().invalidate()
+
+    # automated lines and CI: no Qt, no matplotlib
+    if '--headless' in args:
+        import cli
+        sys.exit(cli.main([arg for arg in args if arg != '--headless']))
+
+    from PyQt5.QtWidgets import QApplication
+    from mainwindow import MainWindow
 
-def main(_):
     app = QApplication(sys.argv)
+
+    # sweeps as asyncio tasks on the Qt event loop, needs qasync, threads otherwise
+    if '--async' in args:
+        try:
+            from asyncinstruments import qt_event_loop
+            loop = qt_event_loop(app)
+        except ImportError:
+            print('qasync not installed, measuring from a worker thread')
+        else:
+            window = MainWindow(asynchronous=True)
+            window.show()
+            with loop:
+                sys.exit(loop.run_forever())
+
     window = MainWindow()
     window.show()
     sys.exit(app.exec_())
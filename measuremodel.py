@@ -1,16 +1,15 @@
 from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QVariant, pyqtSlot
 
+import evaluation
+
 
 class MeasureModel(QAbstractTableModel):
     _default_column_count = 1
     _default_headers = ['№'] * _default_column_count
 
-    _labels = ['Att нач, дБ', 'Fнач, ГГц', 'Fкон, ГГц', 'Err амп, дБ', 'КСВ вх', 'КСВ вых']
+    _labels = evaluation.labels
 
-    _standard = {
-        0: [5, 0.01, 3, 1.0, 2.0, 2.0],
-        1: [15, 0.01, 10, 1.5, 2.0, 2.0]
-    }
+    _standard = evaluation.standard
 
     def __init__(self, parent=None, instrumentManager=None):
         super().__init__(parent)
@@ -23,7 +22,8 @@ class MeasureModel(QAbstractTableModel):
         self._data = {
             0: list(self._labels),
             1: self.makeStandardColumn(self._standard[0]),
-            2: [0] * len(self._standard[0])
+            2: [0] * len(self._standard[0]),
+            3: [''] * len(self._standard[0])
         }
 
         self.initHeader()
@@ -41,11 +41,25 @@ class MeasureModel(QAbstractTableModel):
         self._data = {
             0: list(self._labels),
             1: self.makeStandardColumn(self._standard[chip]),
-            2: [0] * len(self._standard[chip])
+            2: [0] * len(self._standard[chip]),
+            3: [''] * len(self._standard[chip])
         }
         self.endResetModel()
 
-    def initHeader(self, headers=('', 'по ТУ', 'Результат')):
+    def evaluate(self, chip: int):
+        manager = self._instrumentManager
+        if manager is None or not len(manager._res_cube):
+            return
+
+        values, passed = evaluation.evaluate(manager._res_freqs, manager._res_cube, manager._res_atts,
+                                             self._standard[chip])
+
+        self.beginResetModel()
+        self._data[2] = [f'{val:.2f}' for val in values]
+        self._data[3] = ['да' if ok else 'нет' for ok in passed]
+        self.endResetModel()
+
+    def initHeader(self, headers=('', 'по ТУ', 'Результат', 'Годен')):
         self._headers = list(headers)
         self._columnCount = len(headers)
 
@@ -81,3 +95,4 @@ class MeasureModel(QAbstractTableModel):
     @pyqtSlot(int)
     def updateModel(self, chip):
         self.initModel(chip)
+        self.evaluate(chip)
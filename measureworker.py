@@ -0,0 +1,25 @@
+from PyQt5.QtCore import QObject, pyqtSignal, pyqtSlot
+
+
+class MeasureWorker(QObject):
+
+    codeMeasured = pyqtSignal(int, int)
+    measureFinished = pyqtSignal(int)
+    measureFailed = pyqtSignal(str)
+
+    def __init__(self, instrumentManager=None, params=0):
+        super().__init__()
+
+        self._instrumentManager = instrumentManager
+        self._params = params
+
+    @pyqtSlot()
+    def run(self):
+        try:
+            self._instrumentManager.measure(self._params, progress=self.codeMeasured.emit)
+        except Exception as ex:
+            print(ex)
+            # the cube is partial, only the failure is reported
+            self.measureFailed.emit(str(ex))
+            return
+        self.measureFinished.emit(self._params)
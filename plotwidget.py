@@ -1,9 +1,13 @@
-from PyQt5.QtCore import pyqtSlot, Qt
+from itertools import repeat
+
+from PyQt5.QtCore import pyqtSlot, Qt, QTimer
 from PyQt5.QtWidgets import QGridLayout
 
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas, NavigationToolbar2QT as NavToolbar
 from matplotlib.figure import Figure
 
+from traceplot import TracePlot
+
 
 class PlotWidget(QGridLayout):
 
@@ -32,75 +36,58 @@ class PlotWidget(QGridLayout):
 
         self._instrumentManager = instrumentManager
 
-    def plot(self, fig, xs, ys, title='', xlabel='', ylabel=''):
-        fig.clear()
-
-        fig.set_tight_layout(True)
+        self._baseline = TracePlot(self.fig11, 'Вносимые потери', 'F, GHz', 'Ins. loss, dB')
+        self._s11 = TracePlot(self.fig12, 'Вх. обратныые потери', 'F, GHz', 'S11, dB')
+        self._phase_shift = TracePlot(self.fig13, 'Фазовый сдвиг', 'F, GHz', 'Phase shift, deg')
+        self._group_delay = TracePlot(self.fig14, 'Групповое время задержки', 'F, GHz', 'Group delay, ns')
+        self._normalized_att = TracePlot(self.fig21, 'Норм. к-т ослабления', 'F, GHz', 'Normalized att., dB')
+        self._s22 = TracePlot(self.fig22, 'Вых. обратные потери', 'F, GHz', 'S22, dB')
+        self._err_per_code = TracePlot(self.fig23, 'Ошибка для состояния', 'F, GHz', 'Bit error')
+        self._attenuation = TracePlot(self.fig24, 'К-т ослабления, все', 'Lossб dB', 'F, GHz')
 
-        ax = fig.gca()
+        self._plots = [self._baseline, self._s11, self._phase_shift, self._group_delay, self._normalized_att,
+                       self._s22, self._err_per_code, self._attenuation]
 
-        ax.set_title(title)
-        ax.set_xlabel(xlabel, color='r')
-        ax.set_ylabel(ylabel, color='r')
+        # per-code updates come in bursts, redraw at most this often
+        self._redrawTimer = QTimer()
+        self._redrawTimer.setSingleShot(True)
+        self._redrawTimer.setInterval(100)
+        self._redrawTimer.timeout.connect(self.redraw)
 
-        ax.grid(True, linestyle='--')
-        ax.tick_params(labelsize='small', direction='in', pad=2, grid_alpha=0.5)
-
-        for x, y in zip(xs, ys):
-            ax .plot(x, y)
-
-        fig.canvas.draw()
+    def plot(self, plot, ys):
+        plot.update(repeat(self._instrumentManager._res_freqs), ys)
 
     def plot_baseline(self):
-        self.plot(self.fig11,
-                  [self._instrumentManager._res_freqs] * 1,
-                  [self._instrumentManager._res_baseline],
-                  'Вносимые потери',
-                  'F, GHz',
-                  'Ins. loss, dB')
+        self.plot(self._baseline, [self._instrumentManager._res_baseline])
 
     def plot_normalized_att(self):
-        self.plot(self.fig21,
-                  [self._instrumentManager._res_freqs] * 8,
-                  self._instrumentManager._res_normalized_att,
-                  'Норм. к-т ослабления',
-                  'F, GHz',
-                  'Normalized att., dB')
+        self.plot(self._normalized_att, self._instrumentManager._res_normalized_att)
 
     def plot_s11(self):
-        self.plot(self.fig12,
-                  [self._instrumentManager._res_freqs] * 8,
-                  self._instrumentManager._res_s11,
-                  'Вх. обратныые потери',
-                  'F, GHz',
-                  'S11, dB')
+        self.plot(self._s11, self._instrumentManager._res_s11)
 
     def plot_s22(self):
-        self.plot(self.fig22,
-                  [self._instrumentManager._res_freqs] * 8,
-                  self._instrumentManager._res_s22,
-                  'Вых. обратные потери',
-                  'F, GHz',
-                  'S22, dB')
+        self.plot(self._s22, self._instrumentManager._res_s22)
 
     def plot_err_per_code(self):
-        self.plot(self.fig23,
-                  [self._instrumentManager._res_freqs] * 8,
-                  self._instrumentManager._res_att_err_per_code,
-                  'Ошибка для состояния',
-                  'F, GHz',
-                  'Bit error')
+        self.plot(self._err_per_code, self._instrumentManager._res_att_err_per_code)
 
     def plot_attenuation(self):
-        self.plot(self.fig24,
-                  [self._instrumentManager._res_freqs] * 8,
-                  self._instrumentManager._res_att,
-                  'К-т ослабления, все',
-                  'Lossб dB',
-                  'F, GHz')
+        self.plot(self._attenuation, self._instrumentManager._res_att)
+
+    def plot_phase_shift(self):
+        self.plot(self._phase_shift, self._instrumentManager._res_phase_shift)
+
+    def plot_group_delay(self):
+        self.plot(self._group_delay, self._instrumentManager._res_group_delay * 1e9)
 
     @pyqtSlot()
     def updatePlot(self):
+        if not self._redrawTimer.isActive():
+            self._redrawTimer.start()
+
+    @pyqtSlot()
+    def redraw(self):
         print('update plot')
 
         self.plot_baseline()
@@ -111,3 +98,9 @@ class PlotWidget(QGridLayout):
         self.plot_err_per_code()
 
         self.plot_attenuation()
+
+        self.plot_phase_shift()
+        self.plot_group_delay()
+
+        for plot in self._plots:
+            plot.draw()
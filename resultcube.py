@@ -0,0 +1,84 @@
+import numpy
+
+# Result cube layout
+#
+#   cube[code, sparam, point], float64, C order
+#
+#   code   -- position in the sweep's code list, sorted by nominal attenuation,
+#             row 0 is the all-ones baseline state (0 dB)
+#   sparam -- S21, S11, S22 in dB, then real and imaginary S21, linear, see the indices below
+#   point  -- frequency point of the sweep grid
+#
+# cube[i] is one contiguous (5, points) block, one code as read: S21 comes as
+# SDATA into the re/im rows and its dB row is derived from them, S11 and S22
+# come as FDATA, in one bulk MFData read when the analyzer supports it. The
+# block is also the record TraceStore writes; archives from before SDATA have
+# 3 rows per code. cube[:, S21] and friends are strided views across all
+# codes. Both kinds of slices are views, so PlotWidget and MeasureModel can
+# take them without copying; derived arrays below are computed once per sweep.
+
+S21 = 0
+S11 = 1
+S22 = 2
+S21_RE = 3
+S21_IM = 4
+
+sparams = ['S21', 'S11', 'S22', 'S21 re', 'S21 im']
+
+
+def full_codes(levels):
+    # nominal attenuation -> code for every attenuator state, sorted by attenuation,
+    # bit weights come from the single-bit states of a level table (bits are active low)
+    full = 0b111111
+    weights = dict()
+    for att, code in levels.items():
+        bit = full ^ code
+        if bin(bit).count('1') == 1:
+            weights[bit] = att
+
+    codes = {sum((w for bit, w in weights.items() if not code & bit), 0.0): code for code in range(full, -1, -1)}
+    return dict(sorted(codes.items()))
+
+
+def make_cube(codes, points, rows=len(sparams)):
+    # archives from before SDATA have three rows per code
+    return numpy.empty((codes, rows, points), dtype=numpy.float64)
+
+
+def normalized_att(cube):
+    # (codes, points), each code relative to the baseline state
+    return cube[:, S21] - cube[0, S21]
+
+
+def att_err_per_code(norm, atts):
+    # (codes, points), normalized attenuation is negative, nominal is positive
+    return norm + atts[:, numpy.newaxis]
+
+
+def att_err_per_freq(err):
+    # (points,), worst code at every frequency point
+    return numpy.abs(err).max(axis=0)
+
+
+def s21(cube):
+    # (codes, points), complex
+    return cube[:, S21_RE] + 1j * cube[:, S21_IM]
+
+
+def phase(cube):
+    # (codes, points), S21 phase in radians, unwrapped along frequency
+    return numpy.unwrap(numpy.angle(s21(cube)), axis=-1)
+
+
+def phase_shift(phase, baseline):
+    # (..., points), degrees relative to the baseline state's phase,
+    # whole turns the unwrap left at the first point are taken out
+    shift = numpy.degrees(phase - baseline)
+    return shift - 360.0 * numpy.round(shift[..., :1] / 360.0)
+
+
+def group_delay(phase, freqs):
+    # (..., points), seconds, -dphi/domega
+    if phase.shape[-1] < 2:
+        return numpy.zeros_like(phase)
+    return -numpy.gradient(phase, 2 * numpy.pi * numpy.asarray(freqs), axis=-1)
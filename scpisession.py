@@ -0,0 +1,125 @@
+# longest message the analyzer takes in one write, longer batches are split
+max_message = 1024
+
+
+class ScpiSession(object):
+    # write side of the analyzer:
+    # settings remember the last written value and aren't resent while it holds,
+    # writes are queued and go out as one semicolon-joined message,
+    # the first query or write() after them flushes the queue in the same message
+
+    def __init__(self, inst, cache=True, batch=True):
+        self._inst = inst
+        self._cache = cache
+        self._batch = batch
+        self._state = dict()
+        self._pending = list()
+        # the analyzer's whole state is accounted for: preset defaults or a recalled state plus the cache
+        self._known = False
+
+        # messages actually sent, settings skipped because they were already there,
+        # and syncs that found an error in the queue
+        self.writes = 0
+        self.skipped = 0
+        self.errors = 0
+
+    @property
+    def inst(self):
+        return self._inst
+
+    def set(self, header, value, key=None):
+        # key defaults to the header, measurement definitions need the name in it
+        key = (key or header).upper()
+        value = str(value)
+        if self._cache and self._state.get(key) == value:
+            self.skipped += 1
+            return
+        self._state[key] = value
+        self.queue(f'{header} {value}')
+
+    def queue(self, command):
+        # commands that must always go out: events, triggers, sweep mode
+        self._pending.append(command)
+        if not self._batch:
+            self.flush()
+
+    def invalidate(self):
+        # analyzer state is unknown after an error or a reconnect
+        self._state.clear()
+        self._known = False
+
+    def preset(self):
+        # the analyzer is back on its defaults, none of them cached
+        self.queue('SYSTem:FPRESet')
+        self._state.clear()
+        self._known = True
+
+    def snapshot(self):
+        return dict(self._state)
+
+    def restore(self, state):
+        # the analyzer is known to hold these settings, e.g. after a state recall
+        self._state = dict(state)
+        self._known = True
+
+    @property
+    def known(self):
+        return self._known
+
+    def flush(self):
+        if self._pending:
+            self._send(self._take(), last=None)
+
+    def write(self, command):
+        # queued writes and this command in one message, e.g. a data query before read_raw
+        self._pending.append(command)
+        self._send(self._take(), last=None)
+
+    def query(self, question):
+        self._pending.append(question)
+        messages = self._take()
+        return self._send(messages[:-1], last=messages[-1])
+
+    def sync(self):
+        # the one place that waits for the analyzer to finish everything queued so far,
+        # a command the analyzer refused anywhere in a joined message leaves every setting unknown
+        reply = self.query('*OPC?')
+        error = self.query('SYSTem:ERRor?').strip()
+        if not error.startswith(('+0', '0')):
+            self.errors += 1
+            self.invalidate()
+            self.queue('*CLS')
+        return reply
+
+    def _take(self):
+        messages = self._messages(self._pending)
+        self._pending = list()
+        return messages
+
+    def _send(self, messages, last):
+        try:
+            for message in messages:
+                self.writes += 1
+                self._inst.send(message)
+            if last is not None:
+                self.writes += 1
+                return self._inst.query(last)
+        except Exception:
+            # a failed write leaves the settings unknown
+            self.invalidate()
+            raise
+
+    @staticmethod
+    def _messages(commands):
+        # program messages after the first one restart from the root, common commands don't need it
+        messages = list()
+        message = ''
+        for command in commands:
+            part = command if not message or command.startswith(('*', ':')) else ':' + command
+            if message and len(message) + len(part) + 1 > max_message:
+                messages.append(message)
+                message, part = '', command
+            message = f'{message};{part}' if message else part
+        if message:
+            messages.append(message)
+        return messages
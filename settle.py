@@ -0,0 +1,53 @@
+import time
+from collections import defaultdict
+
+import numpy
+
+
+class SettleDetector(object):
+
+    def __init__(self, tolerance=0.05, max_delay=1.0, agree=1):
+        # tolerance in dB between consecutive probes, max_delay is the old fixed sleep
+        self.tolerance = tolerance
+        self.max_delay = max_delay
+        self.agree = agree
+
+        self.history = defaultdict(list)
+
+    def wait(self, probe, code=None):
+        # code None waits without recording, the time isn't a sweep code's
+        start = time.perf_counter()
+
+        agreed = 0
+        prev = probe()
+        while time.perf_counter() - start < self.max_delay:
+            curr = probe()
+            if numpy.max(numpy.abs(curr - prev)) <= self.tolerance:
+                agreed += 1
+                if agreed >= self.agree:
+                    break
+            else:
+                agreed = 0
+            prev = curr
+
+        elapsed = time.perf_counter() - start
+        if code is not None:
+            self.history[code].append(elapsed)
+        return elapsed
+
+    def stats(self):
+        # code -> (count, min, median, max) settle time in seconds
+        return {code: (len(times), min(times), float(numpy.median(times)), max(times))
+                for code, times in sorted(self.history.items())}
+
+    def summary(self):
+        # spread over codes: (codes, median of the per-code medians, 95th percentile, slowest code, its max)
+        stats = self.stats()
+        if not stats:
+            return None
+        medians = numpy.array([median for _, _, median, _ in stats.values()])
+        slowest = max(stats, key=lambda code: stats[code][3])
+        return len(stats), float(numpy.median(medians)), float(numpy.percentile(medians, 95)), slowest, stats[slowest][3]
+
+    def clear(self):
+        self.history.clear()
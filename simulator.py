@@ -0,0 +1,373 @@
+import random
+import re
+import threading
+import time
+
+import numpy
+
+
+# raise on a command the simulator doesn't know instead of only queueing -113,
+# benchmarks run strict so a broken setup fails instead of skewing the timings
+strict = False
+
+
+class SimulatedTimeout(TimeoutError):
+    pass
+
+
+class UndefinedHeader(ValueError):
+    pass
+
+
+class ProgrammerSim(object):
+    # ArduinoParallel stand-in: serial write time at the given baud rate, remembers when the code changed
+
+    def __init__(self, port='SIM', baudrate=9600, latency=0.002, **kwargs):
+        self.name = 'ArduinoParallel sim'
+        self.port = port
+        self._byte_time = 10 / baudrate
+        self._latency = latency
+
+        self._lock = threading.Lock()
+        self.code = 0b111111
+        self.prev_code = 0b111111
+        self.switched = 0.0
+
+    def set_lpf_code(self, code):
+        command = f'LPF,{code}\n'.encode()
+        time.sleep(self._latency + len(command) * self._byte_time)
+        with self._lock:
+            self.prev_code = self.code
+            self.code = code
+            self.switched = time.perf_counter()
+
+    def state(self):
+        with self._lock:
+            return self.prev_code, self.code, self.switched
+
+
+class AnalyzerSim(object):
+    # E8362B stand-in that speaks the subset of SCPI InstrumentManager uses
+    #
+    # timing: every message costs command_latency, a sweep costs point_time per point,
+    # every reply costs len(reply) / bandwidth
+    # traces follow the attached programmer's code, a new state is approached with time constant settle_tau
+    # faults: timeout_rate raises SimulatedTimeout on a reply, garble_rate corrupts it
+
+    def __init__(self, idn='Agilent Technologies,E8362B,SIM0001,A.09.42.08', programmer=None, steps=None,
+                 command_latency=0.001, point_time=20e-6, bandwidth=1_000_000, settle_tau=0.02,
+                 timeout_rate=0.0, garble_rate=0.0, noise=0.01, seed=None):
+        _, self.name, _, _ = idn.split(',')
+        self._idn = idn
+        self._progr = programmer
+        # bit weights of the attenuator, LSB first
+        self._steps = numpy.array(steps if steps is not None else [0.25, 0.5, 1.0, 2.0, 4.0, 8.0])
+
+        self.command_latency = command_latency
+        self.point_time = point_time
+        self.bandwidth = bandwidth
+        self.settle_tau = settle_tau
+        self.timeout_rate = timeout_rate
+        self.garble_rate = garble_rate
+        self.noise = noise
+
+        self._random = random.Random(seed)
+        self._rng = numpy.random.default_rng(seed)
+
+        self.bytes_read = 0
+        self.commands = 0
+
+        # mass storage survives a preset
+        self._files = dict()
+
+        self.preset()
+
+    # instrument state
+    def preset(self):
+        self._channels = dict()
+        self._params = dict()
+        self._mnums = dict()
+        self._selected = dict()
+        self._format = 'ascii'
+        self._dtype = '<f8'
+        self._continuous = True
+        self._errors = list()
+        self._reply = None
+
+    def _channel(self, chan):
+        return self._channels.setdefault(chan, {
+            'points': 201,
+            'f1': 10_000_000.0,
+            'f2': 20_000_000_000.0,
+            'mode': 'CONT',
+            'data': dict(),
+        })
+
+    # driver interface
+    def send(self, command):
+        time.sleep(self.command_latency)
+        for part in command.split(';'):
+            part = part.strip().lstrip(':')
+            if part:
+                self.commands += 1
+                self._handle(part)
+
+    def query(self, question):
+        self.send(question)
+        reply = self._take_reply()
+        if isinstance(reply, bytes):
+            reply = reply.decode(errors='replace')
+        return reply
+
+    def read_raw(self):
+        reply = self._take_reply()
+        if isinstance(reply, str):
+            reply = reply.encode()
+        return reply
+
+    def _take_reply(self):
+        reply, self._reply = self._reply, None
+        if reply is None:
+            raise SimulatedTimeout('no reply pending')
+
+        if self._random.random() < self.timeout_rate:
+            raise SimulatedTimeout('simulated timeout')
+
+        time.sleep(len(reply) / self.bandwidth if self.bandwidth else 0)
+        self.bytes_read += len(reply)
+
+        if self._random.random() < self.garble_rate:
+            cut = self._random.randrange(1, max(len(reply), 2))
+            reply = reply[:cut] + reply[cut:][::-1]
+        return reply
+
+    def _queue(self, reply):
+        # several queries in one message answer with ';'-joined replies
+        if self._reply is None:
+            self._reply = reply
+        elif isinstance(self._reply, str) and isinstance(reply, str):
+            self._reply = self._reply.rstrip('\n') + ';' + reply
+        else:
+            self._reply = reply
+
+    # SCPI
+    _commands = [
+        (r'\*OPC\?', '_opc'),
+        (r'\*CLS', '_cls'),
+        (r'\*IDN\?', '_idn_q'),
+        (r'SYST(EM)?:ERR(OR)?\?', '_error_q'),
+        (r'SYST(EM)?:FPRES(ET)?', '_fpreset'),
+        (r'CALC(ULATE)?(\d*):PAR(AMETER)?:DEF(INE)?:EXT\s+["\'](\w+)["\'],\s*(S\d\d)', '_define'),
+        (r'CALC(ULATE)?(\d*):PAR(AMETER)?:SEL(ECT)?\s+["\'](\w+)["\']', '_select'),
+        (r'CALC(ULATE)?(\d*):PAR(AMETER)?:MNUM(BER)?\?', '_mnum_q'),
+        (r'CALC(ULATE)?(\d*):DATA:MFD(ATA)?\?\s+["\']([\d,]+)["\']', '_mfdata_q'),
+        (r'CALC(ULATE)?(\d*):DATA\?\s+(FDATA|SDATA)', '_data_q'),
+        (r'SENS(E)?(\d*):SWE(EP)?:POIN(TS)?\s+(\d+)', '_points'),
+        (r'SENS(E)?(\d*):FREQ(UENCY)?:STAR(T)?\s+(\S+)', '_start'),
+        (r'SENS(E)?(\d*):FREQ(UENCY)?:STOP\s+(\S+)', '_stop'),
+        (r'SENS(E)?(\d*):SWE(EP)?:MODE\s+(\w+)', '_mode'),
+        (r'SENS(E)?(\d*):X(:VAL(UES)?)?\?', '_x_q'),
+        (r'INIT(IATE)?(\d*):CONT(INUOUS)?\s+(\w+)', '_continuous_mode'),
+        (r'INIT(IATE)?(\d*)(:IMM(EDIATE)?)?', '_init'),
+        (r'FORM(AT)?(:DATA)?\s+(ASC(II)?(,0)?|REAL,(32|64))', '_form'),
+        (r'FORM(AT)?:BORD(ER)?\s+(\w+)', '_border'),
+        (r'MMEM(ORY)?:STOR(E)?\s+["\']([\w.]+)["\']', '_store'),
+        (r'MMEM(ORY)?:LOAD\s+["\']([\w.]+)["\']', '_load'),
+        (r'MMEM(ORY)?:CAT(ALOG)?\?', '_catalog_q'),
+        # accepted, no effect on the simulated data
+        (r'(DISP(LAY)?|SOUR(CE)?\d*|TRIG(GER)?|SENS(E)?\d*:(FOM|SWE(EP)?:TRIG(GER)?))\b.*', '_ignore'),
+    ]
+    _compiled = [(re.compile(pattern + r'$', re.IGNORECASE), handler) for pattern, handler in _commands]
+
+    def _handle(self, command):
+        for pattern, handler in self._compiled:
+            match = pattern.match(command)
+            if match:
+                getattr(self, handler)(match)
+                return
+        if strict:
+            raise UndefinedHeader(command)
+        self._errors.append(f'-113,"Undefined header; {command}"')
+
+    @staticmethod
+    def _chan(text):
+        return int(text) if text else 1
+
+    @staticmethod
+    def _freq(text):
+        units = {'GHZ': 1e9, 'MHZ': 1e6, 'KHZ': 1e3, 'HZ': 1.0}
+        text = text.upper()
+        for unit, scale in units.items():
+            if text.endswith(unit):
+                return float(text[:-len(unit)]) * scale
+        return float(text)
+
+    def _opc(self, _):
+        self._queue('+1\n')
+
+    def _cls(self, _):
+        self._errors.clear()
+
+    def _idn_q(self, _):
+        self._queue(self._idn + '\n')
+
+    def _error_q(self, _):
+        self._queue((self._errors.pop(0) if self._errors else '+0,"No error"') + '\n')
+
+    def _fpreset(self, _):
+        time.sleep(self.command_latency * 100)
+        self.preset()
+
+    def _define(self, m):
+        chan = self._chan(m.group(2))
+        self._params[m.group(5)] = (chan, m.group(6).upper())
+        self._mnums.setdefault(m.group(5), len(self._mnums) + 1)
+        self._channel(chan)
+
+    def _select(self, m):
+        name = m.group(5)
+        if name not in self._params:
+            self._errors.append(f'-224,"Illegal parameter value; {name}"')
+            return
+        self._selected[self._chan(m.group(2))] = name
+
+    def _mnum_q(self, m):
+        name = self._selected.get(self._chan(m.group(2)))
+        self._queue(f'{self._mnums.get(name, 0)}\n')
+
+    def _mfdata_q(self, m):
+        by_mnum = {mnum: name for name, mnum in self._mnums.items()}
+        names = [by_mnum.get(int(n)) for n in m.group(4).split(',')]
+        if None in names:
+            self._errors.append('-224,"Illegal parameter value"')
+            self._queue('0\n')
+            return
+        self._queue(self._encode(numpy.concatenate([self._trace(name, 'FDATA') for name in names])))
+
+    def _data_q(self, m):
+        name = self._selected.get(self._chan(m.group(2)))
+        if name is None:
+            self._errors.append('-221,"Settings conflict; no measurement selected"')
+            self._queue('0\n')
+            return
+        self._queue(self._encode(self._trace(name, m.group(3).upper())))
+
+    def _points(self, m):
+        self._channel(self._chan(m.group(2)))['points'] = int(m.group(5))
+
+    def _start(self, m):
+        self._channel(self._chan(m.group(2)))['f1'] = self._freq(m.group(5))
+
+    def _stop(self, m):
+        self._channel(self._chan(m.group(2)))['f2'] = self._freq(m.group(4))
+
+    def _mode(self, m):
+        chan = self._chan(m.group(2))
+        mode = m.group(4).upper()[:4]
+        self._channel(chan)['mode'] = 'HOLD' if mode == 'SING' else mode
+        if mode == 'SING':
+            self._sweep(chan)
+
+    def _x_q(self, m):
+        self._queue(self._encode(self._freqs(self._chan(m.group(2)))))
+
+    def _continuous_mode(self, m):
+        self._continuous = m.group(4).upper() in ['ON', '1']
+
+    def _init(self, m):
+        self._sweep(self._chan(m.group(2)))
+
+    def _form(self, m):
+        fmt = m.group(3).upper()
+        if fmt.startswith('ASC'):
+            self._format = 'ascii'
+        else:
+            self._format = 'real'
+            self._dtype = self._dtype[0] + ('f4' if fmt.endswith('32') else 'f8')
+
+    def _border(self, m):
+        order = '<' if m.group(3).upper().startswith('SWAP') else '>'
+        self._dtype = order + self._dtype[1:]
+
+    def _store(self, m):
+        # instrument state without the measured data, the transfer format isn't part of it
+        time.sleep(self.command_latency * 100)
+        channels = {chan: dict(ch, data=dict()) for chan, ch in self._channels.items()}
+        self._files[m.group(3).lower()] = (channels, dict(self._params), dict(self._mnums), dict(self._selected),
+                                           self._continuous)
+
+    def _load(self, m):
+        state = self._files.get(m.group(2).lower())
+        if state is None:
+            self._errors.append(f'-256,"File name not found; {m.group(2)}"')
+            return
+        time.sleep(self.command_latency * 100)
+        channels, params, mnums, selected, continuous = state
+        self.preset()
+        self._channels = {chan: dict(ch, data=dict()) for chan, ch in channels.items()}
+        self._params, self._mnums, self._selected = dict(params), dict(mnums), dict(selected)
+        self._continuous = continuous
+
+    def _catalog_q(self, _):
+        self._queue('"' + ','.join(sorted(self._files)) + '"\n')
+
+    def _ignore(self, _):
+        pass
+
+    # data model
+    def _freqs(self, chan):
+        ch = self._channel(chan)
+        return numpy.linspace(ch['f1'], ch['f2'], ch['points'])
+
+    def _sweep(self, chan):
+        # freeze the channel's data as it is right now, sweep takes time in proportion to points
+        ch = self._channel(chan)
+        time.sleep(ch['points'] * self.point_time)
+        ch['data'] = {name: self._compute(chan, sparam) for name, (c, sparam) in self._params.items() if c == chan}
+
+    def _trace(self, name, kind):
+        chan, sparam = self._params[name]
+        ch = self._channel(chan)
+        if self._continuous and ch['mode'] == 'CONT' or name not in ch['data']:
+            # free-running channel, the reply holds whatever the last sweep saw
+            ch['data'][name] = self._compute(chan, sparam)
+        data = ch['data'][name]
+        if kind == 'SDATA':
+            return numpy.column_stack((data.real, data.imag)).ravel()
+        return 20 * numpy.log10(numpy.abs(data))
+
+    def _attenuation(self):
+        if self._progr is None:
+            return 0.0
+        prev, code, switched = self._progr.state()
+        bits = numpy.arange(len(self._steps))
+        target = self._steps[(~code >> bits) & 1 == 1].sum()
+        before = self._steps[(~prev >> bits) & 1 == 1].sum()
+        # first-order approach to the new state
+        elapsed = time.perf_counter() - switched
+        return target + (before - target) * numpy.exp(-elapsed / self.settle_tau)
+
+    def _compute(self, chan, sparam):
+        f = self._freqs(chan) / 1e9
+        att = self._attenuation()
+        noise = self._rng.normal(0, self.noise, len(f))
+
+        if sparam == 'S21':
+            ripple = 0.05 * numpy.sin(f * 2.1)
+            mag_db = -(1.2 + 0.12 * f) - att * (1 + 0.004 * f) + ripple + noise
+            # through delay plus a small state-dependent delay
+            delay = 250e-12 + att * 0.4e-12
+            phase = -2 * numpy.pi * f * 1e9 * delay
+        else:
+            base = -24.0 if sparam == 'S11' else -27.0
+            mag_db = base + 1.1 * f + 0.02 * att + noise
+            phase = -numpy.pi * f / 3
+
+        return numpy.power(10, mag_db / 20) * numpy.exp(1j * phase)
+
+    def _encode(self, values):
+        if self._format == 'ascii':
+            return ','.join(f'{v:+.12E}' for v in values) + '\n'
+        payload = numpy.asarray(values, dtype=self._dtype).tobytes()
+        length = str(len(payload))
+        return f'#{len(length)}{length}'.encode() + payload + b'\n'
@@ -0,0 +1,46 @@
+import time
+
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+
+
+class StageTimer(object):
+    # wall-clock time of the acquisition stages, per code and per sweep
+
+    def __init__(self, telemetry=None):
+        self.records = list()
+        # stages also go to the telemetry stream when it's on
+        self._telemetry = telemetry
+        # stages without an explicit code are booked to the code being measured
+        self.code = None
+
+    @contextmanager
+    def stage(self, name, code=None):
+        code = self.code if code is None else code
+        span = nullcontext() if self._telemetry is None else self._telemetry.span('stage', name, code=code)
+        start = time.perf_counter()
+        try:
+            with span:
+                yield
+        finally:
+            self.records.append((name, code, time.perf_counter() - start))
+
+    def clear(self):
+        self.records.clear()
+        self.code = None
+
+    def totals(self):
+        # stage -> (calls, total seconds)
+        result = defaultdict(lambda: [0, 0.0])
+        for name, _, elapsed in self.records:
+            result[name][0] += 1
+            result[name][1] += elapsed
+        return {name: tuple(value) for name, value in result.items()}
+
+    def per_code(self):
+        # code -> stage -> total seconds, stages outside the code loop are left out
+        result = defaultdict(lambda: defaultdict(float))
+        for name, code, elapsed in self.records:
+            if code is not None:
+                result[code][name] += elapsed
+        return {code: dict(stages) for code, stages in result.items()}
@@ -0,0 +1,130 @@
+import queue
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from instrumentmanager import InstrumentManager
+
+
+class Station(object):
+    # one analyzer + programmer pair with its own instrument manager,
+    # without a store of their own all stations write the process-wide one for store_path
+
+    def __init__(self, name, analyzer, progr, store=None, fast_mock=False):
+        self.name = name
+        self.manager = InstrumentManager(store=store)
+        self.manager.attach(analyzer, progr, fast_mock=fast_mock)
+
+        self.chips = 0
+        self.busy = 0.0
+
+    @classmethod
+    def mock(cls, name, store=None):
+        import serial
+        from instr.agilente8362bmock import AgilentE8362BMock
+        from arduino.arduinoparallelmock import ArduinoParallelMock
+
+        return cls(name,
+                   AgilentE8362BMock(idn=f'Agilent,E8362B mock,{name},firmware'),
+                   ArduinoParallelMock(port='COM4', baudrate=9600, parity=serial.PARITY_NONE, bytesize=8,
+                                       stopbits=serial.STOPBITS_ONE, timeout=1),
+                   store=store, fast_mock=True)
+
+    @classmethod
+    def sim(cls, name, store=None, **kwargs):
+        from simulator import AnalyzerSim, ProgrammerSim
+
+        progr = ProgrammerSim()
+        analyzer = AnalyzerSim(idn=f'Agilent Technologies,E8362B,{name},A.09.42.08', programmer=progr, **kwargs)
+        return cls(name, analyzer, progr, store=store)
+
+    def measure_chip(self, chip, chip_type):
+        start = time.perf_counter()
+
+        present = self.manager.checkSample()
+        if present:
+            self.manager.measure(chip_type, chip=chip)
+
+        elapsed = time.perf_counter() - start
+        self.chips += 1
+        self.busy += elapsed
+
+        # every measure allocates fresh arrays, keeping references is safe
+        result = {
+            'chip': chip,
+            'chip_type': chip_type,
+            'station': self.name,
+            'present': present,
+            'elapsed': elapsed,
+        }
+        if present:
+            result.update({
+                'freqs': self.manager._res_freqs,
+                'atts': self.manager._res_atts,
+                'cube': self.manager._res_cube,
+            })
+        return result
+
+
+class StationScheduler(object):
+    # feeds chips to stations from a shared queue, one worker thread per station
+
+    def __init__(self, stations):
+        self._stations = list(stations)
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+
+        self.results = dict()
+        self.failed = dict()
+        self.elapsed = 0.0
+
+    def run(self, chips):
+        # chips: iterable of (serial, chip type)
+        todo = queue.Queue()
+        for chip in chips:
+            todo.put(chip)
+
+        self._cancel.clear()
+        start = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=len(self._stations)) as pool:
+            for station in self._stations:
+                pool.submit(self._station_loop, station, todo)
+
+        self.elapsed = time.perf_counter() - start
+        print(f'scheduler: {len(self.results)} chips in {self.elapsed:.1f} s, {self.throughput():.1f} chips/hour')
+        return self.results
+
+    def cancel(self):
+        self._cancel.set()
+        for station in self._stations:
+            station.manager.cancel()
+
+    def _station_loop(self, station, todo):
+        while not self._cancel.is_set():
+            try:
+                chip, chip_type = todo.get_nowait()
+            except queue.Empty:
+                break
+
+            print(f'{station.name}: measure chip {chip}')
+            try:
+                result = station.measure_chip(chip, chip_type)
+            except Exception as ex:
+                print(f'{station.name}: chip {chip} failed: {ex}')
+                with self._lock:
+                    self.failed[chip] = str(ex)
+                continue
+
+            with self._lock:
+                self.results[chip] = result
+
+    def throughput(self):
+        if not self.elapsed:
+            return 0.0
+        return len(self.results) / self.elapsed * 3600
+
+    def station_stats(self):
+        # station name -> (chips, busy seconds)
+        return {station.name: (station.chips, station.busy) for station in self._stations}
@@ -0,0 +1,192 @@
+import csv
+import threading
+import time
+
+from collections import deque, namedtuple
+from contextlib import nullcontext
+
+# start is time.perf_counter(), duration in seconds, size in bytes written plus read
+Event = namedtuple('Event', 'start duration kind name code size')
+
+# kinds that are instrument traffic, they count towards commands/s and bytes/s
+traffic = {'send', 'query', 'read_raw', 'set_lpf_code'}
+
+_disabled = nullcontext()
+
+
+class Telemetry(object):
+    # ring buffer of timed events, sinks see every event as it's recorded
+    # disabled telemetry records nothing, spans are a shared no-op context
+
+    def __init__(self, enabled=False, echo=True, capacity=65536):
+        self.enabled = enabled
+        # log messages still go to the console with telemetry off
+        self.echo = echo
+        self.events = deque(maxlen=capacity)
+        self.sinks = list()
+        # attenuator code the events are booked to, set by the measure loop
+        self.code = None
+        self._lock = threading.Lock()
+
+    def record(self, kind, name, start, size=0, code=None):
+        event = Event(start, time.perf_counter() - start, kind, name, self.code if code is None else code, size)
+        with self._lock:
+            self.events.append(event)
+            for sink in self.sinks:
+                sink.write(event)
+
+    def span(self, kind, name='', size=0, code=None):
+        if not self.enabled:
+            return _disabled
+        return Span(self, kind, name, size, code)
+
+    def log(self, message):
+        if self.echo:
+            print(message)
+        if self.enabled:
+            self.record('log', str(message), time.perf_counter())
+
+    def debug(self, message):
+        # hot loop messages, kept only as events
+        if self.enabled:
+            self.record('log', message, time.perf_counter())
+
+    def rates(self, window=1.0):
+        # (commands/s, bytes/s) of instrument traffic over the last window seconds
+        since = time.perf_counter() - window
+        commands = size = 0
+        with self._lock:
+            for event in reversed(self.events):
+                if event.start < since:
+                    break
+                if event.kind in traffic:
+                    commands += 1
+                    size += event.size
+        return commands / window, size / window
+
+    def totals(self):
+        # (commands, bytes, seconds) of instrument traffic in the buffer
+        with self._lock:
+            events = [event for event in self.events if event.kind in traffic]
+        if not events:
+            return 0, 0, 0.0
+        elapsed = events[-1].start + events[-1].duration - events[0].start
+        return len(events), sum(event.size for event in events), elapsed
+
+    def add_sink(self, sink):
+        with self._lock:
+            self.sinks.append(sink)
+        return sink
+
+    def remove_sink(self, sink):
+        with self._lock:
+            self.sinks.remove(sink)
+        sink.close()
+
+    def clear(self):
+        with self._lock:
+            self.events.clear()
+        self.code = None
+
+    def close(self):
+        with self._lock:
+            sinks, self.sinks = self.sinks, list()
+        for sink in sinks:
+            sink.close()
+
+
+class Span(object):
+    # one event timed over a with block, the block can add to its size, e.g. the reply length
+
+    __slots__ = ('_telemetry', '_start', 'kind', 'name', 'size', 'code')
+
+    def __init__(self, telemetry, kind, name, size=0, code=None):
+        self._telemetry = telemetry
+        self._start = 0.0
+        self.kind = kind
+        self.name = name
+        self.size = size
+        self.code = code
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._telemetry.record(self.kind, self.name, self._start, self.size, self.code)
+        return False
+
+
+class LogSink(object):
+
+    def __init__(self, path):
+        self._file = open(path, 'at', encoding='utf-8')
+
+    def write(self, event):
+        code = '' if event.code is None else f' code={event.code}'
+        self._file.write(f'{event.start:.6f} {event.duration * 1000:9.3f} ms {event.kind:>12} '
+                         f'{event.size:>7} B{code} {event.name}\n')
+
+    def close(self):
+        self._file.close()
+
+
+class CsvSink(object):
+
+    def __init__(self, path):
+        self._file = open(path, 'wt', encoding='utf-8', newline='')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(Event._fields)
+
+    def write(self, event):
+        self._writer.writerow(event)
+
+    def close(self):
+        self._file.close()
+
+
+class TracedInstrument(object):
+    # instrument proxy, every command, reply and code switch becomes an event,
+    # with telemetry off a call costs one flag check on top of the driver's
+
+    def __init__(self, inst, telemetry):
+        self._inst = inst
+        self._telemetry = telemetry
+        # only offer raw reads if the driver has them, setup_format relies on it
+        if hasattr(inst, 'read_raw'):
+            self.read_raw = self._read_raw
+
+    @property
+    def inst(self):
+        return self._inst
+
+    def __getattr__(self, name):
+        return getattr(self._inst, name)
+
+    def send(self, command):
+        if not self._telemetry.enabled:
+            return self._inst.send(command)
+        with self._telemetry.span('send', command, len(command)):
+            return self._inst.send(command)
+
+    def query(self, question):
+        if not self._telemetry.enabled:
+            return self._inst.query(question)
+        with self._telemetry.span('query', question, len(question)) as span:
+            reply = self._inst.query(question)
+            span.size += len(reply)
+            return reply
+
+    def _read_raw(self, *args, **kwargs):
+        if not self._telemetry.enabled:
+            return self._inst.read_raw(*args, **kwargs)
+        with self._telemetry.span('read_raw') as span:
+            block = self._inst.read_raw(*args, **kwargs)
+            span.size = len(block)
+            return block
+
+    def set_lpf_code(self, code):
+        if not self._telemetry.enabled:
+            return self._inst.set_lpf_code(code)
+        with self._telemetry.span('set_lpf_code', str(code), code=code):
+            return self._inst.set_lpf_code(code)
@@ -0,0 +1,128 @@
+import json
+import os
+
+import numpy
+
+import resultcube
+
+from tracestore import trace_dtype
+
+
+class TraceHistory(object):
+    # read side of TraceStore: small in-memory index, trace data stays memory-mapped
+
+    def __init__(self, path='results'):
+        self.path = path
+
+        # sweep id -> chip, chip_type, ts, sparams, points, freqs offset, codes {code: (att, offset)}, complete
+        self.sweeps = dict()
+        # chip -> sweep ids, oldest first
+        self.chips = dict()
+
+        self._index_pos = 0
+        self._traces = None
+        self._freqs = None
+
+        self.reload()
+
+    def reload(self):
+        # picks up sweeps appended since the last call, only the new index lines are parsed
+        index = os.path.join(self.path, 'index.jsonl')
+        if not os.path.isfile(index):
+            return
+
+        with open(index, mode='rt', encoding='utf-8') as f:
+            f.seek(self._index_pos)
+            while True:
+                line = f.readline()
+                if not line.endswith('\n'):
+                    # half-written line from a live writer, read it next time
+                    break
+                self._index_pos = f.tell()
+                self._add(json.loads(line))
+
+        self._traces = self._map('traces.f64')
+        self._freqs = self._map('freqs.f64')
+
+    def _add(self, entry):
+        kind = entry['kind']
+        sweep = entry['sweep']
+        if kind == 'sweep':
+            self.sweeps[sweep] = {
+                'chip': entry['chip'],
+                'chip_type': entry['chip_type'],
+                'ts': entry['ts'],
+                'sparams': entry['sparams'],
+                'points': entry['points'],
+                'freqs': entry['freqs'],
+                'codes': dict(),
+                'complete': False,
+            }
+            self.chips.setdefault(entry['chip'], list()).append(sweep)
+        elif kind == 'code':
+            self.sweeps[sweep]['codes'][entry['code']] = (entry['att'], entry['offset'])
+        elif kind == 'end':
+            self.sweeps[sweep]['complete'] = entry['complete']
+
+    def _map(self, name):
+        path = os.path.join(self.path, name)
+        if not os.path.isfile(path) or os.path.getsize(path) < trace_dtype.itemsize:
+            return numpy.empty(0, dtype=trace_dtype)
+        return numpy.memmap(path, dtype=trace_dtype, mode='r')
+
+    def freqs(self, sweep):
+        info = self.sweeps[sweep]
+        start = info['freqs'] // trace_dtype.itemsize
+        return self._freqs[start:start + info['points']]
+
+    def code_block(self, sweep, code):
+        # (sparams, points) view of one code, nothing is read until it's touched
+        info = self.sweeps[sweep]
+        _, offset = info['codes'][code]
+        start = offset // trace_dtype.itemsize
+        size = info['sparams'] * info['points']
+        return self._traces[start:start + size].reshape(info['sparams'], info['points'])
+
+    def trace(self, sweep, code, sparam=resultcube.S21):
+        return self.code_block(sweep, code)[sparam]
+
+    def select(self, chip_type=None, chips=None, complete=True, latest=True):
+        # sweep ids matching the filter, one per chip when latest is set
+        result = list()
+        for chip, sweeps in self.chips.items():
+            if chips is not None and chip not in chips:
+                continue
+            candidates = [s for s in sweeps
+                          if (chip_type is None or self.sweeps[s]['chip_type'] == chip_type)
+                          and (not complete or self.sweeps[s]['complete'])]
+            if latest:
+                candidates = candidates[-1:]
+            result.extend(candidates)
+        return result
+
+    def code_slice(self, code, sparam=resultcube.S21, sweeps=None, chip_type=None):
+        # one code's trace across many chips -> (sweep ids, (n, points) array)
+        # only the requested rows are paged in, sweeps on a different grid are skipped
+        if sweeps is None:
+            sweeps = self.select(chip_type=chip_type)
+        sweeps = [s for s in sweeps if code in self.sweeps[s]['codes']]
+        if not sweeps:
+            return list(), numpy.empty((0, 0))
+
+        points = self.sweeps[sweeps[0]]['points']
+        sweeps = [s for s in sweeps if self.sweeps[s]['points'] == points]
+
+        out = numpy.empty((len(sweeps), points), dtype=trace_dtype)
+        for row, sweep in enumerate(sweeps):
+            out[row] = self.trace(sweep, code, sparam)
+        return sweeps, out
+
+    def load_cube(self, sweep):
+        # full (codes, sparams, points) cube of one sweep plus its atts, codes in stored order
+        info = self.sweeps[sweep]
+        codes = info['codes']
+        cube = resultcube.make_cube(len(codes), info['points'], info['sparams'])
+        for row, code in enumerate(codes):
+            cube[row] = self.code_block(sweep, code)
+        atts = numpy.fromiter((att for att, _ in codes.values()), dtype=numpy.float64, count=len(codes))
+        return numpy.fromiter(codes.keys(), dtype=int, count=len(codes)), atts, cube
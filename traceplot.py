@@ -0,0 +1,121 @@
+import numpy
+
+# views decimated to this many different zoom levels are kept per figure
+lod_cache_size = 16
+
+
+def minmax_decimate(x, y, x0, x1, buckets):
+    # per-pixel min/max envelope of the part of a trace inside [x0, x1], x must be sorted
+    lo, hi = numpy.searchsorted(x, [x0, x1])
+    lo, hi = max(lo - 1, 0), min(hi + 1, len(x))
+    x, y = x[lo:hi], y[lo:hi]
+
+    if len(x) <= 2 * buckets:
+        return x, y
+
+    starts = numpy.linspace(0, len(x), buckets, endpoint=False).astype(numpy.intp)
+
+    xd = numpy.repeat(x[starts], 2)
+    xd[-1] = x[-1]
+
+    yd = numpy.empty(2 * buckets, dtype=y.dtype)
+    yd[0::2] = numpy.minimum.reduceat(y, starts)
+    yd[1::2] = numpy.maximum.reduceat(y, starts)
+    return xd, yd
+
+
+class TracePlot(object):
+    # axes and lines of one figure are created once, updates only swap the data
+
+    def __init__(self, fig, title='', xlabel='', ylabel='', lod=True):
+        self.fig = fig
+        self.ax = fig.gca()
+
+        self.ax.set_title(title)
+        self.ax.set_xlabel(xlabel, color='r')
+        self.ax.set_ylabel(ylabel, color='r')
+
+        self.ax.grid(True, linestyle='--')
+        self.ax.tick_params(labelsize='small', direction='in', pad=2, grid_alpha=0.5)
+
+        self.lines = list()
+
+        # full resolution data, lines only ever get a decimated copy for the current view
+        self._xs = list()
+        self._ys = list()
+        self._lod = lod
+        self._lod_cache = dict()
+
+        # tight layout is the most expensive part of a draw, only redo it when the layout may change
+        self._relayout = True
+        self.fig.canvas.mpl_connect('resize_event', self._on_resize)
+        self.ax.callbacks.connect('xlim_changed', self._on_xlim_changed)
+
+    def _on_resize(self, _):
+        self._relayout = True
+        self._apply_lod()
+
+    def _on_xlim_changed(self, _):
+        # toolbar zoom/pan, pick the right level of detail for the new view
+        self._apply_lod()
+
+    def update(self, xs, ys):
+        ys = [numpy.asarray(y) for y in ys]
+        xs = [numpy.asarray(x) for x, _ in zip(xs, ys)]
+
+        if len(self.lines) != len(ys):
+            self._relayout = True
+
+        while len(self.lines) < len(ys):
+            # fixed colour per row, so a restarted sweep keeps its colours
+            line, = self.ax.plot([], [], color=f'C{len(self.lines) % 10}')
+            self.lines.append(line)
+        while len(self.lines) > len(ys):
+            self.lines.pop().remove()
+
+        self._xs = xs
+        self._ys = ys
+        self._lod_cache.clear()
+
+        if self.ax.get_autoscalex_on():
+            # decimate against the full data range, autoscale will end up there anyway
+            self._apply_lod(self._data_xlim())
+        else:
+            self._apply_lod()
+
+        self.ax.relim()
+        self.ax.autoscale_view()
+
+    def _data_xlim(self):
+        xs = [x for x in self._xs if len(x)]
+        if not xs:
+            return self.ax.get_xlim()
+        return min(x[0] for x in xs), max(x[-1] for x in xs)
+
+    def _apply_lod(self, xlim=None):
+        if not self._xs:
+            return
+
+        x0, x1 = xlim if xlim is not None else self.ax.get_xlim()
+        buckets = max(int(self.ax.bbox.width), 1)
+
+        key = (x0, x1, buckets)
+        data = self._lod_cache.get(key)
+        if data is None:
+            if self._lod:
+                data = [minmax_decimate(x, y, x0, x1, buckets) for x, y in zip(self._xs, self._ys)]
+            else:
+                data = list(zip(self._xs, self._ys))
+
+            if len(self._lod_cache) >= lod_cache_size:
+                self._lod_cache.clear()
+            self._lod_cache[key] = data
+
+        for line, (x, y) in zip(self.lines, data):
+            line.set_data(x, y)
+
+    def draw(self):
+        if self._relayout:
+            self.fig.tight_layout()
+            self._relayout = False
+        self.fig.canvas.draw_idle()
@@ -0,0 +1,113 @@
+import json
+import os
+import threading
+import time
+import uuid
+
+import numpy
+
+# Store layout, one directory per archive
+#
+#   traces.f64  -- raw little-endian float64, one (sparams, points) record per measured code
+#   freqs.f64   -- raw little-endian float64, one frequency grid per sweep
+#   index.jsonl -- one JSON line per record:
+#       {"kind": "sweep", "sweep", "chip", "chip_type", "ts", "sparams", "points", "freqs"}
+#       {"kind": "code", "sweep", "code", "att", "offset"}
+#       {"kind": "end", "sweep", "complete", "codes"}
+#
+# Offsets are in bytes. Data is flushed before its index line is written,
+# so after a crash the index only ever points at complete records and an
+# unfinished sweep simply has no "end" line.
+
+trace_dtype = numpy.dtype('<f8')
+
+# store directory -> the one TraceStore writing it, offsets are only right with a single writer
+_shared = dict()
+_shared_lock = threading.Lock()
+
+
+def shared_store(path='results'):
+    # managers and stations without a store of their own append through this one
+    key = os.path.abspath(path)
+    with _shared_lock:
+        store = _shared.get(key)
+        if store is None or store.closed:
+            store = _shared[key] = TraceStore(path)
+        return store
+
+
+class TraceStore(object):
+
+    def __init__(self, path='results', durable=False):
+        # durable: fsync every record, survives power loss at the cost of disk latency
+        self.path = path
+        self._durable = durable
+        self._lock = threading.Lock()
+
+        os.makedirs(path, exist_ok=True)
+        self._traces = open(os.path.join(path, 'traces.f64'), mode='ab')
+        self._freqs = open(os.path.join(path, 'freqs.f64'), mode='ab')
+        self._index = open(os.path.join(path, 'index.jsonl'), mode='at', encoding='utf-8')
+
+        self._codes = dict()
+        self.closed = False
+
+    def begin_sweep(self, chip, chip_type, freqs, sparams=3):
+        sweep = uuid.uuid4().hex
+        with self._lock:
+            offset = self._write(self._freqs, freqs)
+            self._write_index({
+                'kind': 'sweep',
+                'sweep': sweep,
+                'chip': str(chip),
+                'chip_type': int(chip_type),
+                'ts': time.time(),
+                'sparams': sparams,
+                'points': len(freqs),
+                'freqs': offset,
+            })
+            self._codes[sweep] = 0
+        return sweep
+
+    def append_code(self, sweep, code, att, traces):
+        # traces: (sparams, points) block of one code, written as is
+        with self._lock:
+            offset = self._write(self._traces, traces)
+            self._write_index({
+                'kind': 'code',
+                'sweep': sweep,
+                'code': int(code),
+                'att': float(att),
+                'offset': offset,
+            })
+            self._codes[sweep] += 1
+
+    def end_sweep(self, sweep, complete=True):
+        with self._lock:
+            self._write_index({
+                'kind': 'end',
+                'sweep': sweep,
+                'complete': complete,
+                'codes': self._codes.pop(sweep, 0),
+            })
+
+    def close(self):
+        with self._lock:
+            for f in [self._traces, self._freqs, self._index]:
+                f.close()
+            self.closed = True
+
+    def _write(self, f, data):
+        offset = f.tell()
+        f.write(memoryview(numpy.ascontiguousarray(data, dtype=trace_dtype)))
+        self._sync(f)
+        return offset
+
+    def _write_index(self, entry):
+        self._index.write(json.dumps(entry) + '\n')
+        self._sync(self._index)
+
+    def _sync(self, f):
+        f.flush()
+        if self._durable:
+            os.fsync(f.fileno())